@@ -0,0 +1,141 @@
+'''asyncio interface to UCI chess engines.
+
+This module is Python 3 only (3.6 or newer) and stands alone: the rest
+of chessbox is Python 2, so AsyncEngine cannot be used in the same
+interpreter as Position, CachedEngine or EnginePool. Besides asyncio it
+only needs uci.py and move.py, which import under both. One event loop
+can drive many engine processes concurrently:
+
+  async def main():
+    engines = [await AsyncEngine.start("./stockfish") for i in range(8)]
+    analyses = await asyncio.gather(*[
+      engine.analyse(moves, Limit(depth=18)) for engine, moves in zip(engines, positions)])
+
+Each AsyncEngine runs one search at a time; concurrent calls on the same
+engine wait for each other.
+'''
+import asyncio
+
+from uci import *
+
+class AsyncEngine:
+  """Represents a chess engine driven from an asyncio event loop."""
+
+  def __init__(self, process):
+    self.process = process
+    self.name = None
+    self.options = {}
+    self._multipv = 1
+    self._lock = asyncio.Lock()
+
+  @classmethod
+  async def start(cls, engine_path, options={}):
+    '''Starts the engine process, does the UCI handshake and applies options.'''
+    process = await asyncio.create_subprocess_exec(
+      engine_path,
+      stdin=asyncio.subprocess.PIPE,
+      stdout=asyncio.subprocess.PIPE,
+    )
+    engine = cls(process)
+    await engine._handshake()
+    for name, value in options.items():
+      await engine.set_option(name, value)
+    await engine.wait_ready()
+    return engine
+
+  async def _handshake(self):
+    await self._put("uci")
+    async for line in self._read_until("uciok"):
+      if line.startswith("id name "):
+        self.name = line[len("id name "):]
+      elif line.startswith("option name "):
+        option = parse_option(line)
+        if option:
+          self.options[option[0]] = option[1]
+
+  async def set_option(self, name, value):
+    await self._put("setoption name %s value %s" % (name, value))
+
+  async def wait_ready(self):
+    await self._put("isready")
+    async for line in self._read_until("readyok"):
+      pass
+
+  async def new_game(self):
+    '''Tells the engine that the next positions are from a different game.'''
+    async with self._lock:
+      await self._put("ucinewgame")
+      await self.wait_ready()
+
+  async def infos(self, moves=None, limit=None, fen=None, multipv=1, analysis=None):
+    '''Searches a position, yielding each parsed info dictionary as the
+    engine reports it.
+
+    If an Analysis is passed in it is filled in as the search goes and
+    holds the best move once iteration ends:
+
+      analysis = Analysis()
+      async for info in engine.infos(moves, Limit(movetime=5000), analysis=analysis):
+        print(info.get("depth"), info.get("score"))
+      print(analysis.bestmove)
+    '''
+    if limit is None:
+      limit = Limit(depth=20)
+    if analysis is None:
+      analysis = Analysis()
+    async with self._lock:
+      if multipv != self._multipv:
+        await self.set_option("MultiPV", multipv)
+        self._multipv = multipv
+      await self._put(position_command(moves, fen))
+      await self._put(limit.go_command())
+      try:
+        async for line in self._read_until("bestmove"):
+          if line.startswith("info "):
+            info = parse_info(line)
+            analysis.add_info(info)
+            yield info
+          elif line.startswith("bestmove"):
+            analysis.bestmove, analysis.ponder = parse_bestmove(line)
+      except GeneratorExit:
+        # the caller stopped iterating, finish the search so the next
+        # command is not answered with this search's output
+        await self._put("stop")
+        async for line in self._read_until("bestmove"):
+          pass
+        raise
+
+  async def analyse(self, moves=None, limit=None, fen=None, multipv=1):
+    '''Searches a position and returns an Analysis.'''
+    analysis = Analysis()
+    async for info in self.infos(moves, limit, fen, multipv, analysis):
+      pass
+    return analysis
+
+  async def play(self, moves=None, limit=None, fen=None):
+    '''Returns the engine's best move (long algebraic) for a position.'''
+    analysis = await self.analyse(moves, limit, fen)
+    return analysis.bestmove
+
+  async def quit(self):
+    await self._put("quit")
+    self.process.stdin.close()
+    await self.process.wait()
+
+  async def _put(self, command):
+    self.process.stdin.write(("%s\n" % command).encode())
+    await self.process.stdin.drain()
+
+  async def _read_until(self, prefix):
+    '''Yields engine output lines up to and including the first one
+    starting with prefix.'''
+    while True:
+      text = await self.process.stdout.readline()
+      if not text:
+        raise EOFError("Engine terminated while waiting for '%s'." % prefix)
+      text = text.decode().strip()
+      if text == '':
+        continue
+      yield text
+      if text.startswith(prefix):
+        break
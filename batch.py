@@ -0,0 +1,122 @@
+'''Parallel processing of PGN files.
+
+A PGN file is split at game boundaries into byte ranges, the ranges are
+parsed and replayed by a pool of worker processes, and the per-game
+results are streamed back in file order.
+
+  for result in process_pgn("twic.pgn", processes=8):
+    if not result.error:
+      print result.fens[-1]
+'''
+import multiprocessing
+import os
+
+import instrument
+from game import Game
+from position import Position
+from pgn import RESULTS, read_buffer, close_buffer, next_game_offset
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+class GameResult:
+  """The outcome of replaying one game."""
+
+  def __init__(self, attributes, long_moves=None, fens=None, error=None):
+    self.attributes = attributes
+    self.long_moves = long_moves or []
+    self.fens = fens or []
+    self.error = error
+
+def split_pgn(path, chunk_size=MAX_CHUNK_SIZE):
+  '''Returns (start, end) byte ranges of path that each hold whole games.'''
+  ranges = []
+  with open(path, "rb") as pgn_file:
+    data, start = read_buffer(pgn_file)
+    try:
+      size = len(data)
+      while start < size:
+        end = next_game_offset(data, min(start + chunk_size, size))
+        if end <= start:
+          end = size
+        ranges.append((start, end))
+        start = end
+    finally:
+      close_buffer(data)
+  return ranges
+
+def default_chunk_size(path, processes=None):
+  '''Returns a range size giving about four ranges per worker process.'''
+  workers = processes or multiprocessing.cpu_count()
+  chunk_size = os.path.getsize(path) // (workers * 4)
+  return min(max(chunk_size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+def _run_job(args):
+  function, job = args
+  with instrument.worker_profile():
+    result = function(job)
+  return result, instrument.collect()
+
+def run_ranges(function, path, args=(), processes=None, chunk_size=None, ordered=True):
+  '''Calls function((path, start, end) + args) for the byte ranges of
+  split_pgn(path, chunk_size) in a pool of processes and yields the
+  results, in file order or, if not ordered, as they are done. The
+  instrument statistics of the workers are merged into this process.
+
+  processes defaults to the number of CPUs and chunk_size to
+  default_chunk_size.
+  '''
+  if not chunk_size:
+    chunk_size = default_chunk_size(path, processes)
+  jobs = [(function, (path, start, end) + tuple(args)) for start, end in split_pgn(path, chunk_size)]
+  # forked workers start with a copy of this process's statistics
+  # and profiler
+  pool = multiprocessing.Pool(processes, instrument.init_worker)
+  try:
+    results = ordered and pool.imap(_run_job, jobs) or pool.imap_unordered(_run_job, jobs)
+    for result, stats in results:
+      instrument.merge(stats)
+      yield result
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
+
+def replay_game(game, with_fens=True):
+  '''Replays the moves of a game and returns a GameResult.'''
+  position = Position()
+  long_moves = []
+  fens = []
+  try:
+    for move in game.moves:
+      if move.startswith('{') or move in RESULTS:
+        continue
+      long_moves.append("%s%s%s" % position.move(move))
+      if with_fens:
+        fens.append(position.generate_fen())
+  except Exception, err:
+    return GameResult(game.attributes, long_moves, fens, "%s (%s)" % (move, err))
+  return GameResult(game.attributes, long_moves, fens)
+
+def read_games(path, start, end):
+  '''Yields the games stored in the byte range [start, end) of path.'''
+  with open(path, "rb") as pgn_file:
+    pgn_file.seek(start)
+    data = pgn_file.read(end - start)
+  for game in Game.iter_lazy_games(data):
+    yield game
+
+def _process_range(args):
+  path, start, end, with_fens = args
+  return [replay_game(game, with_fens) for game in read_games(path, start, end)]
+
+def process_pgn(path, processes=None, chunk_size=None, with_fens=True):
+  '''Replays every game of a PGN file using a pool of processes.
+
+  Yields a GameResult per game, in the order the games appear in the file.
+  processes defaults to the number of CPUs. By default the file is split
+  into about four ranges per process so that the workers stay busy.
+  '''
+  for results in run_ranges(_process_range, path, (with_fens,), processes, chunk_size):
+    for result in results:
+      yield result
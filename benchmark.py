@@ -0,0 +1,475 @@
+#! /usr/bin/env python
+
+'''Benchmarks for chessbox hot paths.
+
+  python benchmark.py                            # generated corpus
+  python benchmark.py games.pgn --json run.json
+  python benchmark.py --engine ./stockfish --compare run.json
+  python benchmark.py --only replay --only fen
+
+Without a PGN file the corpus is --games random legal games generated
+from --seed, so runs are reproducible and the benchmarks see varied
+positions and moves. Each benchmark runs in a fresh worker process and
+reports its peak resident memory (peak_rss_kb) along with its rate,
+the best of --repeat runs. --json writes the results and a description
+of the machine; --compare prints the change of every rate against such
+a file.
+'''
+import argparse
+import gc
+import json
+import multiprocessing
+import platform
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+from board import square_name, square_file, square_rank
+from game import Game
+from position import Position
+
+PLAYERS = ["Player %03i" % n for n in range(200)]
+GAME_RESULTS = ["1-0", "0-1", "1/2-1/2"]
+
+def legacy_parse_moves(token):
+  '''The original Game.parse_moves, kept as a baseline.'''
+  moves = []
+  while token:
+    token = re.sub(r'^\s*(\d+\.+\s*)?', '', token)
+
+    if token.startswith('{'):
+      pos = token.find('}')+1
+    else:
+      pos1 = token.find(' ')
+      pos2 = token.find('{')
+      if pos1 <= 0:
+        pos = pos2
+      elif pos2 <= 0:
+        pos = pos1
+      else:
+        pos = min([pos1, pos2])
+
+    if pos > 0:
+      moves.append(token[:pos])
+      token = token[pos:]
+    else:
+      moves.append(token)
+      token = ''
+
+  return moves
+
+def legacy_parse_san(command):
+  '''The regular expressions the original Position.move_process_main
+  tried in turn, kept as a baseline.'''
+  if command in ["O-O", "o-o", "0-0"] or command in ["O-O-O", "o-o-o", "0-0-0"]:
+    return command
+  for pattern in (r'^([BNRQK])([a-h])?([1-8])?x?([a-h][0-8])',
+                  r'^([a-h][0-8])-?([a-h][0-8])=?([QRBNqrbn])?',
+                  r'^([a-h][0-8]-)?([a-h][0-8])',
+                  r'[a-h]x[a-h][0-8]',
+                  r'([a-h])[0-8]x([a-h][0-8])'):
+    matching = re.match(pattern, command)
+    if matching:
+      return matching.groups()
+
+def move_san(position, move, moves):
+  '''Returns the SAN of one of the legal moves of a position, without
+  the check suffix.'''
+  piece = position.board.get(move.from_square)
+  target = square_name(move.to_square)
+  if piece.lower_symbol == "k" and abs(move.to_square - move.from_square) == 2:
+    return move.to_square > move.from_square and "O-O" or "O-O-O"
+  if piece.lower_symbol == "p":
+    san = target
+    if square_file(move.to_square) != square_file(move.from_square):
+      san = square_name(move.from_square)[0] + "x" + target
+    if move.promotion:
+      san += "=" + move.promotion.upper()
+    return san
+  others = [other.from_square for other in moves
+            if other.to_square == move.to_square and other.from_square != move.from_square
+            and position.board.get(other.from_square).symbol == piece.symbol]
+  origin = ""
+  if others:
+    origin = square_name(move.from_square)
+    if all(square_file(other) != square_file(move.from_square) for other in others):
+      origin = origin[0]
+    elif all(square_rank(other) != square_rank(move.from_square) for other in others):
+      origin = origin[1]
+  capture = position.board.get(move.to_square) is not None and "x" or ""
+  return piece.symbol.upper() + origin + capture + target
+
+def random_movetext(rnd, plies):
+  '''Returns the movetext of a random legal game of at most plies plies,
+  with the odd comment, NAG and variation.'''
+  position = Position()
+  tokens = []
+  for ply in range(plies):
+    moves = position.legal_moves()
+    if not moves:
+      break
+    move = rnd.choice(moves)
+    san = move_san(position, move, moves)
+    position.move(move.uci())
+    king = position.board.bitboards[position.current_player == "w" and "K" or "k"]
+    opponent = position.current_player == "w" and "b" or "w"
+    if position.attackers_to(square_name(king.bit_length() - 1), opponent):
+      san += position.legal_moves() and "+" or "#"
+    if ply % 2 == 0:
+      tokens.append("%i." % (ply // 2 + 1))
+    tokens.append(san)
+    roll = rnd.random()
+    if roll < 0.01:
+      tokens.append("{a comment}")
+    elif roll < 0.02:
+      tokens.append("$%i" % rnd.randint(1, 6))
+    elif roll < 0.025:
+      tokens.append("(%i%s %s)" % (ply // 2 + 1, ply % 2 and "..." or ".", san))
+  return " ".join(tokens)
+
+def generate_pgn(game_count=1000, seed=1):
+  '''Returns the text of a PGN file with game_count random legal games of
+  20 to 120 plies, the same for the same seed.'''
+  rnd = random.Random(seed)
+  games = []
+  for i in range(game_count):
+    result = rnd.choice(GAME_RESULTS)
+    games.append('[Event "Generated %i"]\n[White "%s"]\n[Black "%s"]\n[Result "%s"]\n\n%s %s\n' % (
+      i + 1, rnd.choice(PLAYERS), rnd.choice(PLAYERS), result,
+      random_movetext(rnd, rnd.randint(20, 120)), result))
+  return "\n".join(games)
+
+def movetexts_from_pgn(text):
+  '''Returns the raw movetext of every game in a PGN text.'''
+  movetexts = []
+  lines = []
+  for line in text.splitlines():
+    line = line.strip()
+    if line.startswith('['):
+      if lines:
+        movetexts.append("\n".join(lines))
+        lines = []
+    elif line:
+      lines.append(line)
+  if lines:
+    movetexts.append("\n".join(lines))
+  return movetexts
+
+def timed(function, items, repeat=3):
+  '''Returns the best wall-clock time of calling function on every item.'''
+  best = None
+  for i in range(repeat):
+    start = time.time()
+    for item in items:
+      function(item)
+    elapsed = time.time() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best
+
+class LegacyPiece:
+  '''The original dictionary based Piece, kept as a memory baseline.'''
+
+  def __init__(self, symbol="", position=""):
+    self.is_white = symbol.upper() == symbol
+    self.is_black = not self.is_white
+    if self.is_white:
+      self.player = "w"
+    else:
+      self.player = "b"
+    self.symbol = symbol
+    self.lower_symbol = symbol.lower()
+    self.position = position
+    self.square = None
+
+SHARED_TYPES = (type, types.ClassType, types.ModuleType, types.FunctionType,
+                types.BuiltinFunctionType)
+
+def deep_size(obj, seen=None):
+  '''Returns the bytes used by obj and the objects it references, not
+  counting classes, modules and functions, which all instances share.'''
+  if seen is None:
+    seen = set()
+  size = 0
+  pending = [obj]
+  while pending:
+    obj = pending.pop()
+    if id(obj) in seen or isinstance(obj, SHARED_TYPES):
+      continue
+    seen.add(id(obj))
+    size += sys.getsizeof(obj)
+    pending.extend(gc.get_referents(obj))
+  return size
+
+def with_legacy_pieces(position):
+  '''Replaces the pieces of a position with LegacyPiece copies.'''
+  board = position.board
+  for symbol, pieces in board.piece_lists.items():
+    legacy_pieces = []
+    for piece in pieces:
+      legacy = LegacyPiece(piece.symbol, piece.position)
+      legacy.square = piece.square
+      board.squares[piece.square] = legacy
+      legacy_pieces.append(legacy)
+    board.piece_lists[symbol] = legacy_pieces
+  return position
+
+def load_corpus(options):
+  '''Returns the PGN text the benchmarks run on.'''
+  if options.pgn:
+    return open(options.pgn, "r").read()
+  return generate_pgn(options.games, options.seed)
+
+def rate_result(unit, items, seconds, **extra):
+  result = {"unit": unit, "items": items, "seconds": seconds, "rate": items / seconds}
+  result.update(extra)
+  return result
+
+def replay_fens(games, limit):
+  '''Returns the FENs after every ply of games, at most limit of them.'''
+  fens = []
+  for game in games:
+    position = Position()
+    try:
+      for move in game.mainline_moves():
+        position.move(move)
+        fens.append(position.generate_fen())
+        if len(fens) >= limit:
+          return fens
+    except Exception:
+      pass
+  return fens
+
+def bench_parse(text, options):
+  '''Games/s parsed by Game.games_from_pgn.'''
+  lines = text.splitlines()
+  seconds = timed(Game.games_from_pgn, [lines], options.repeat)
+  return rate_result("games/s", len(Game.games_from_pgn(lines)), seconds)
+
+def bench_lazy_parse(text, options):
+  '''Games/s of a header filtered job (lazy games_from_pgn, then the
+  estimated ply count of the games won by white), against eager parsing.'''
+  def job(lazy):
+    games = Game.games_from_pgn(text.splitlines(), lazy=lazy)
+    return [game.estimated_ply_count() for game in games if game.attributes.get("result") == "1-0"]
+  eager = timed(job, [False], options.repeat)
+  seconds = timed(job, [True], options.repeat)
+  return rate_result("games/s", len(Game.games_from_pgn(text.splitlines(), lazy=True)), seconds,
+                     legacy_rate=len(Game.games_from_pgn(text.splitlines())) / eager)
+
+def bench_parse_moves(text, options):
+  '''Games/s through Game.parse_moves, against the original parser.'''
+  movetexts = movetexts_from_pgn(text)
+  legacy = timed(legacy_parse_moves, movetexts, options.repeat)
+  seconds = timed(Game.parse_moves, movetexts, options.repeat)
+  return rate_result("games/s", len(movetexts), seconds, legacy_rate=len(movetexts) / legacy)
+
+def bench_san(text, options):
+  '''Moves/s through san.parse_san with its memo, and without it.'''
+  import san
+
+  moves = []
+  for game in Game.games_from_pgn(text.splitlines()):
+    moves.extend(game.mainline_moves())
+  legacy = timed(legacy_parse_san, moves, options.repeat)
+  uncached = timed(san._parse, moves, options.repeat)
+  san.clear_cache()
+  seconds = timed(san.parse_san, moves, options.repeat)
+  return rate_result("moves/s", len(moves), seconds, legacy_rate=len(moves) / legacy,
+                     uncached_rate=len(moves) / uncached)
+
+def bench_replay(text, options):
+  '''Plies/s replayed through Position.move.'''
+  games = Game.games_from_pgn(text.splitlines())
+  counts = {"plies": 0, "errors": 0}
+  def replay(game):
+    position = Position()
+    try:
+      for move in game.mainline_moves():
+        position.move(move)
+        counts["plies"] += 1
+    except Exception:
+      counts["errors"] += 1
+  seconds = timed(replay, games, options.repeat)
+  return rate_result("plies/s", counts["plies"] // options.repeat, seconds,
+                     errors=counts["errors"] // options.repeat)
+
+def bench_fen(text, options):
+  '''FENs/s from Position.generate_fen, encoding every rank (the cached
+  ranks of the positions are dropped before each call).'''
+  games = Game.games_from_pgn(text.splitlines())
+  positions = [Position(fen) for fen in replay_fens(games, options.positions)]
+  def generate_fen(position):
+    position.board.rank_fens = [None] * 8
+    position.board.placement = None
+    position.generate_fen()
+  seconds = timed(generate_fen, positions, options.repeat)
+  return rate_result("FENs/s", len(positions), seconds)
+
+def bench_game_fens(text, options):
+  '''FENs/s from fen.fens_for_game, replaying the moves included.'''
+  from fen import fens_for_game
+
+  games = Game.games_from_pgn(text.splitlines())
+  counts = {"fens": 0}
+  def replay(game):
+    try:
+      for fen in fens_for_game(game):
+        counts["fens"] += 1
+    except Exception:
+      pass
+  seconds = timed(replay, games, options.repeat)
+  return rate_result("FENs/s", counts["fens"] // options.repeat, seconds)
+
+def bench_diagrams(text, options):
+  '''Diagrams/s written by Position.save_image.'''
+  games = Game.games_from_pgn(text.splitlines())
+  positions = [Position(fen) for fen in replay_fens(games, options.diagrams)]
+  directory = tempfile.mkdtemp()
+  try:
+    filenames = ["%s/%i.png" % (directory, n) for n in range(len(positions))]
+    save = lambda (position, filename): position.save_image(filename)
+    seconds = timed(save, zip(positions, filenames), options.repeat)
+  finally:
+    shutil.rmtree(directory)
+  return rate_result("diagrams/s", len(positions), seconds)
+
+def bench_engine(text, options):
+  '''Positions/s analysed by an Engine to --depth.'''
+  if not options.engine:
+    return {"skipped": "no --engine given"}
+  from engine import Engine
+  from uci import Limit
+
+  positions = []
+  for game in Game.games_from_pgn(text.splitlines()):
+    moves = list(game.generate_long_algebraic_moves())
+    positions.extend(moves[:ply] for ply in range(len(moves)))
+    if len(positions) >= options.engine_positions:
+      break
+  positions = positions[:options.engine_positions]
+  engine = Engine(options.engine)
+  try:
+    limit = Limit(depth=options.depth)
+    seconds = timed(lambda moves: engine.analyse(moves, limit), positions, 1)
+  finally:
+    engine.quit()
+  return rate_result("positions/s", len(positions), seconds, depth=options.depth)
+
+def bench_memory(text, options):
+  '''Bytes used by the starting position, with the original dictionary
+  based pieces and with the current ones.'''
+  position = Position()
+  pieces = position.pieces
+  return {
+    "unit": "bytes",
+    "position": deep_size(position),
+    "piece": (deep_size(pieces) - deep_size([])) // len(pieces),
+    "legacy_position": deep_size(with_legacy_pieces(Position())),
+    "legacy_piece": (deep_size(with_legacy_pieces(Position()).pieces) - deep_size([])) // len(pieces),
+  }
+
+BENCHMARKS = [
+  ("parse", bench_parse),
+  ("lazy_parse", bench_lazy_parse),
+  ("parse_moves", bench_parse_moves),
+  ("san", bench_san),
+  ("replay", bench_replay),
+  ("fen", bench_fen),
+  ("game_fens", bench_game_fens),
+  ("diagrams", bench_diagrams),
+  ("engine", bench_engine),
+  ("memory", bench_memory),
+]
+
+def run_benchmark(args):
+  '''Runs one benchmark, in a worker process of its own.'''
+  name, options, text = args
+  gc.collect()
+  result = dict(BENCHMARKS)[name](text, options)
+  result["name"] = name
+  result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return result
+
+def run_benchmarks(options):
+  '''Returns the results of the selected benchmarks, in BENCHMARKS order.'''
+  results = []
+  # generated once, the workers get the text
+  text = load_corpus(options)
+  for name, function in BENCHMARKS:
+    if options.only and name not in options.only:
+      continue
+    pool = multiprocessing.Pool(1)
+    try:
+      results.append(pool.apply(run_benchmark, ((name, options, text),)))
+      pool.close()
+    finally:
+      pool.terminate()
+      pool.join()
+  return results
+
+def machine_info():
+  return {
+    "platform": platform.platform(),
+    "machine": platform.machine(),
+    "processor": platform.processor(),
+    "cpus": multiprocessing.cpu_count(),
+    "python": platform.python_version(),
+  }
+
+def format_result(result, baseline=None):
+  if "skipped" in result:
+    return "%-12s skipped (%s)" % (result["name"], result["skipped"])
+  if "rate" not in result:
+    fields = ", ".join("%s %s" % (key, result[key]) for key in sorted(result)
+                       if key not in ("name", "unit", "peak_rss_kb"))
+    return "%-12s %s: %s" % (result["name"], result["unit"], fields)
+  line = "%-12s %12.0f %-12s peak %7i KB" % (result["name"], result["rate"], result["unit"],
+                                             result["peak_rss_kb"])
+  if "legacy_rate" in result:
+    line += "  (legacy %.0f)" % result["legacy_rate"]
+  if "uncached_rate" in result:
+    line += "  (uncached %.0f)" % result["uncached_rate"]
+  if baseline and baseline.get("rate"):
+    line += "  %+.1f%%" % (100.0 * result["rate"] / baseline["rate"] - 100)
+  return line
+
+def build_parser():
+  parser = argparse.ArgumentParser(description="Benchmarks for chessbox hot paths.")
+  parser.add_argument("pgn", nargs="?", help="PGN corpus (default: generated)")
+  parser.add_argument("--games", type=int, default=1000, help="games in the generated corpus")
+  parser.add_argument("--seed", type=int, default=1, help="random seed of the generated corpus")
+  parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the best counts")
+  parser.add_argument("--positions", type=int, default=5000, help="positions for the fen benchmark")
+  parser.add_argument("--diagrams", type=int, default=200, help="positions for the diagrams benchmark")
+  parser.add_argument("--engine", help="UCI engine for the engine benchmark")
+  parser.add_argument("--engine-positions", type=int, default=100)
+  parser.add_argument("--depth", type=int, default=10)
+  parser.add_argument("--only", action="append", choices=[name for name, function in BENCHMARKS],
+                      help="run only this benchmark (repeatable)")
+  parser.add_argument("--json", help="write the results to this file")
+  parser.add_argument("--compare", help="results file of an earlier run to compare with")
+  return parser
+
+if __name__ == "__main__":
+  options = build_parser().parse_args()
+  baselines = {}
+  if options.compare:
+    baselines = dict((result["name"], result) for result in json.load(open(options.compare))["results"])
+  results = run_benchmarks(options)
+  for result in results:
+    print format_result(result, baselines.get(result["name"]))
+  if options.json:
+    with open(options.json, "w") as json_file:
+      json.dump({
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": machine_info(),
+        "corpus": options.pgn or "generated %i games, seed %i" % (options.games, options.seed),
+        "repeat": options.repeat,
+        "results": results,
+      }, json_file, indent=2, sort_keys=True)
@@ -0,0 +1,254 @@
+'''Bitboard attack tables and legal move generation.
+
+A bitboard is a Python integer with bit n set when square n (see
+board.py, a1 = 0 .. h8 = 63) is part of the set. Knight, king and pawn
+attacks are precomputed per square; sliding attacks use classical ray
+lookup: the ray in each direction is cut at the first blocker.
+'''
+
+from board import *
+from move import Move
+
+BB_ALL = (1 << 64) - 1
+BB_SQUARES = [1 << index for index in range(64)]
+
+NORTH, SOUTH, EAST, WEST = 8, -8, 1, -1
+NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST = 9, 7, -7, -9
+
+ROOK_DIRECTIONS = (NORTH, SOUTH, EAST, WEST)
+BISHOP_DIRECTIONS = (NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST)
+
+def _step(index, file_delta, rank_delta):
+  to_file = square_file(index) + file_delta
+  to_rank = square_rank(index) + rank_delta
+  if 0 <= to_file < 8 and 0 <= to_rank < 8:
+    return to_rank * 8 + to_file
+  return None
+
+def _leaper_table(deltas):
+  table = []
+  for index in range(64):
+    bb = 0
+    for file_delta, rank_delta in deltas:
+      to_index = _step(index, file_delta, rank_delta)
+      if to_index is not None:
+        bb |= BB_SQUARES[to_index]
+    table.append(bb)
+  return table
+
+_DIRECTION_DELTAS = {
+  NORTH: (0, 1), SOUTH: (0, -1), EAST: (1, 0), WEST: (-1, 0),
+  NORTH_EAST: (1, 1), NORTH_WEST: (-1, 1),
+  SOUTH_EAST: (1, -1), SOUTH_WEST: (-1, -1),
+}
+
+def _ray_table(direction):
+  file_delta, rank_delta = _DIRECTION_DELTAS[direction]
+  table = []
+  for index in range(64):
+    bb = 0
+    to_index = _step(index, file_delta, rank_delta)
+    while to_index is not None:
+      bb |= BB_SQUARES[to_index]
+      to_index = _step(to_index, file_delta, rank_delta)
+    table.append(bb)
+  return table
+
+KNIGHT_ATTACKS = _leaper_table(
+  [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+KING_ATTACKS = _leaper_table(
+  [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)])
+PAWN_ATTACKS = {
+  "w": _leaper_table([(-1, 1), (1, 1)]),
+  "b": _leaper_table([(-1, -1), (1, -1)]),
+}
+RAYS = dict((direction, _ray_table(direction)) for direction in _DIRECTION_DELTAS)
+
+def lsb(bb):
+  '''Index of the least significant set bit.'''
+  return (bb & -bb).bit_length() - 1
+
+def msb(bb):
+  '''Index of the most significant set bit.'''
+  return bb.bit_length() - 1
+
+def popcount(bb):
+  return bin(bb).count("1")
+
+def iter_bits(bb):
+  while bb:
+    low = bb & -bb
+    yield low.bit_length() - 1
+    bb ^= low
+
+def _ray_attacks(index, occupied, direction):
+  ray = RAYS[direction][index]
+  blockers = ray & occupied
+  if not blockers:
+    return ray
+  if direction > 0:
+    blocker = lsb(blockers)
+  else:
+    blocker = msb(blockers)
+  return ray ^ RAYS[direction][blocker]
+
+def bishop_attacks(index, occupied):
+  return (_ray_attacks(index, occupied, NORTH_EAST) |
+          _ray_attacks(index, occupied, NORTH_WEST) |
+          _ray_attacks(index, occupied, SOUTH_EAST) |
+          _ray_attacks(index, occupied, SOUTH_WEST))
+
+def rook_attacks(index, occupied):
+  return (_ray_attacks(index, occupied, NORTH) |
+          _ray_attacks(index, occupied, SOUTH) |
+          _ray_attacks(index, occupied, EAST) |
+          _ray_attacks(index, occupied, WEST))
+
+def queen_attacks(index, occupied):
+  return bishop_attacks(index, occupied) | rook_attacks(index, occupied)
+
+def piece_attacks(symbol, index, occupied):
+  '''Squares attacked by a piece of the given symbol standing on index.'''
+  lower_symbol = symbol.lower()
+  if lower_symbol == "n":
+    return KNIGHT_ATTACKS[index]
+  elif lower_symbol == "k":
+    return KING_ATTACKS[index]
+  elif lower_symbol == "b":
+    return bishop_attacks(index, occupied)
+  elif lower_symbol == "r":
+    return rook_attacks(index, occupied)
+  elif lower_symbol == "q":
+    return queen_attacks(index, occupied)
+  elif symbol == "P":
+    return PAWN_ATTACKS["w"][index]
+  else:
+    return PAWN_ATTACKS["b"][index]
+
+def _opponent(player):
+  if player == "w":
+    return "b"
+  return "w"
+
+def _symbols(player):
+  if player == "w":
+    return "KQRBNP"
+  return "kqrbnp"
+
+def attackers_mask(bitboards, player, index, occupied, mask=BB_ALL):
+  '''Bitboard of the pieces of player (restricted to mask) attacking index.'''
+  king, queen, rook, bishop, knight, pawn = _symbols(player)
+  queens = bitboards[queen]
+  return mask & (
+    (KNIGHT_ATTACKS[index] & bitboards[knight]) |
+    (KING_ATTACKS[index] & bitboards[king]) |
+    (PAWN_ATTACKS[_opponent(player)][index] & bitboards[pawn]) |
+    (bishop_attacks(index, occupied) & (bitboards[bishop] | queens)) |
+    (rook_attacks(index, occupied) & (bitboards[rook] | queens)))
+
+def is_square_attacked(board, player, index):
+  '''Whether any piece of player attacks the square index.'''
+  occupied = board.occupied["w"] | board.occupied["b"]
+  return attackers_mask(board.bitboards, player, index, occupied) != 0
+
+def leaves_king_safe(board, player, from_index, to_index, captured_index=None):
+  '''Whether moving the piece on from_index to to_index keeps the king of
+  player out of check. captured_index is the square of the captured piece
+  when it differs from to_index (en passant).'''
+  if captured_index is None:
+    captured_index = to_index
+  from_bb = BB_SQUARES[from_index]
+  to_bb = BB_SQUARES[to_index]
+  captured_bb = BB_SQUARES[captured_index]
+
+  occupied = ((board.occupied["w"] | board.occupied["b"]) &
+              ~from_bb & ~captured_bb) | to_bb
+
+  king_bb = board.bitboards[_symbols(player)[0]]
+  if king_bb & from_bb:
+    king_index = to_index
+  elif king_bb:
+    king_index = lsb(king_bb)
+  else:
+    return True
+
+  mask = BB_ALL & ~captured_bb
+  return not attackers_mask(board.bitboards, _opponent(player), king_index,
+                            occupied, mask)
+
+def generate_legal_moves(board, player, castle_info="-", enpassant="-"):
+  '''Returns the list of legal Moves for player.'''
+  moves = []
+  own = board.occupied[player]
+  enemy = board.occupied[_opponent(player)]
+  occupied = own | enemy
+  king, queen, rook, bishop, knight, pawn = _symbols(player)
+
+  def add(from_index, to_index, captured_index=None, promote=False):
+    if not leaves_king_safe(board, player, from_index, to_index, captured_index):
+      return
+    if promote:
+      for promotion in "qrbn":
+        moves.append(Move(from_index, to_index, promotion))
+    else:
+      moves.append(Move(from_index, to_index))
+
+  for symbol in (king, queen, rook, bishop, knight):
+    for from_index in iter_bits(board.bitboards[symbol]):
+      targets = piece_attacks(symbol, from_index, occupied) & ~own
+      for to_index in iter_bits(targets):
+        add(from_index, to_index)
+
+  if player == "w":
+    forward, start_rank, last_rank = 8, 1, 7
+  else:
+    forward, start_rank, last_rank = -8, 6, 0
+
+  enpassant_index = SQUARE_INDEX.get(enpassant)
+  for from_index in iter_bits(board.bitboards[pawn]):
+    to_index = from_index + forward
+    promote = square_rank(to_index) == last_rank
+    if not occupied & BB_SQUARES[to_index]:
+      add(from_index, to_index, promote=promote)
+      double_index = to_index + forward
+      if (square_rank(from_index) == start_rank and
+          not occupied & BB_SQUARES[double_index]):
+        add(from_index, double_index)
+    for to_index in iter_bits(PAWN_ATTACKS[player][from_index] & enemy):
+      add(from_index, to_index, promote=promote)
+    if (enpassant_index is not None and
+        PAWN_ATTACKS[player][from_index] & BB_SQUARES[enpassant_index]):
+      add(from_index, enpassant_index, enpassant_index - forward)
+
+  moves.extend(_castling_moves(board, player, castle_info, occupied))
+  return moves
+
+def _castling_moves(board, player, castle_info, occupied):
+  moves = []
+  if player == "w":
+    rights, row = ("K", "Q"), 0
+  else:
+    rights, row = ("k", "q"), 56
+  king_index = row + 4
+  king_symbol = _symbols(player)[0]
+  rook_symbol = _symbols(player)[2]
+  if not board.bitboards[king_symbol] & BB_SQUARES[king_index]:
+    return moves
+  opponent = _opponent(player)
+  if is_square_attacked(board, opponent, king_index):
+    return moves
+
+  # (right, rook square, squares that must be empty, squares the king crosses)
+  sides = ((rights[0], row + 7, (row + 5, row + 6), (row + 5, row + 6)),
+           (rights[1], row, (row + 1, row + 2, row + 3), (row + 3, row + 2)))
+  for right, rook_index, empty, crossed in sides:
+    if right not in castle_info:
+      continue
+    if not board.bitboards[rook_symbol] & BB_SQUARES[rook_index]:
+      continue
+    if [index for index in empty if occupied & BB_SQUARES[index]]:
+      continue
+    if [index for index in crossed if is_square_attacked(board, opponent, index)]:
+      continue
+    moves.append(Move(king_index, crossed[1]))
+  return moves
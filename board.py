@@ -0,0 +1,112 @@
+'''Array-backed board representation.
+
+Squares are addressed by integer index, a1 = 0, b1 = 1, ..., h8 = 63,
+so the file of a square is ``index & 7`` and its rank ``index >> 3``.
+The board keeps a 64-entry mailbox array for O(1) square lookups,
+a list of pieces per piece symbol for fast piece lookups, and a
+bitboard per piece symbol and per player for attack generation (see
+bitboard.py). It also maintains the piece part of the position's
+Zobrist key (see zobrist.py).
+'''
+from zobrist import PIECE_KEYS
+
+PUT, REMOVE, RELOCATE = 0, 1, 2
+
+FILES = "abcdefgh"
+RANKS = "12345678"
+PIECE_SYMBOLS = "KQRBNPkqrbnp"
+
+SQUARE_NAMES = [f + r for r in RANKS for f in FILES]
+SQUARE_INDEX = dict((name, index) for index, name in enumerate(SQUARE_NAMES))
+SQUARE_FILES = [index & 7 for index in range(64)]
+SQUARE_RANKS = [index >> 3 for index in range(64)]
+FILE_NUMBERS = dict((name, number) for number, name in enumerate(FILES))
+
+def square_index(name):
+  '''Returns the integer index of a square name such as "e4".'''
+  return SQUARE_INDEX[name]
+
+def square_name(index):
+  '''Returns the name of a square index, e.g. 28 becomes "e4".'''
+  return SQUARE_NAMES[index]
+
+def square_file(index):
+  return index & 7
+
+def square_rank(index):
+  return index >> 3
+
+class Board:
+  """Represents the placement of pieces on the 64 squares."""
+
+  def __init__(self):
+    self.squares = [None] * 64
+    self.piece_lists = dict((symbol, []) for symbol in PIECE_SYMBOLS)
+    self.bitboards = dict((symbol, 0) for symbol in PIECE_SYMBOLS)
+    self.occupied = {"w": 0, "b": 0}
+    self.zobrist = 0
+    # list of (operation, piece, square) tuples while a move is recorded
+    self.journal = None
+    # FEN of each rank and of the whole placement, None once changed (see fen.py)
+    self.rank_fens = [None] * 8
+    self.placement = None
+
+  def get(self, index):
+    return self.squares[index]
+
+  def put(self, piece, index):
+    '''Places a piece that is not yet on the board.'''
+    if self.journal is not None:
+      self.journal.append((PUT, piece, index))
+    piece.square = index
+    self.squares[index] = piece
+    self.rank_fens[index >> 3] = self.placement = None
+    self.piece_lists[piece.symbol].append(piece)
+    bit = 1 << index
+    self.bitboards[piece.symbol] |= bit
+    self.occupied[piece.player] |= bit
+    self.zobrist ^= PIECE_KEYS[piece.symbol][index]
+
+  def remove(self, piece):
+    '''Takes a piece off the board.'''
+    if self.journal is not None:
+      self.journal.append((REMOVE, piece, piece.square))
+    self.squares[piece.square] = None
+    self.rank_fens[piece.square >> 3] = self.placement = None
+    self.piece_lists[piece.symbol].remove(piece)
+    bit = 1 << piece.square
+    self.bitboards[piece.symbol] &= ~bit
+    self.occupied[piece.player] &= ~bit
+    self.zobrist ^= PIECE_KEYS[piece.symbol][piece.square]
+
+  def relocate(self, piece, index):
+    '''Moves a piece already on the board to another (empty) square.'''
+    if self.journal is not None:
+      self.journal.append((RELOCATE, piece, piece.square))
+    self.squares[piece.square] = None
+    self.rank_fens[piece.square >> 3] = self.rank_fens[index >> 3] = self.placement = None
+    bits = (1 << piece.square) | (1 << index)
+    self.bitboards[piece.symbol] ^= bits
+    self.occupied[piece.player] ^= bits
+    keys = PIECE_KEYS[piece.symbol]
+    self.zobrist ^= keys[piece.square] ^ keys[index]
+    piece.square = index
+    self.squares[index] = piece
+
+  def undo(self, journal):
+    '''Reverts the operations recorded in journal.'''
+    recording, self.journal = self.journal, None
+    for operation, piece, index in reversed(journal):
+      if operation == PUT:
+        self.remove(piece)
+      elif operation == REMOVE:
+        self.put(piece, index)
+      else:
+        self.relocate(piece, index)
+    self.journal = recording
+
+  def pieces(self):
+    return [piece for piece in self.squares if piece]
+
+  def pieces_of(self, symbol):
+    return self.piece_lists[symbol]
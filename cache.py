@@ -0,0 +1,184 @@
+'''Cache of engine analyses keyed by position.
+
+Analyses are stored under a canonical key of the position (the FEN
+without move counters) and reused for any request the stored search
+covers: a depth 25 result answers a depth 18 request, a 2 line MultiPV
+result answers a single line request. Entries live in an in-memory LRU
+and, optionally, in a SQLite file shared between runs.
+
+  engine = CachedEngine(Engine("./stockfish-231-64"), AnalysisCache(path="analysis.db"))
+  analysis = engine.analyse(["e2e4", "e7e5"], Limit(depth=20))
+'''
+import collections
+import json
+import sqlite3
+
+from uci import *
+from board import SQUARE_INDEX
+from bitboard import PAWN_ATTACKS
+from position import Position
+
+def position_key(position):
+  '''Returns a canonical key for a Position.
+
+  The halfmove clock and move number are dropped, and the en passant
+  square is only kept when an en passant capture is actually possible,
+  so transpositions share a key.
+  '''
+  fields = position.generate_fen().split(" ")
+  if fields[3] != "-":
+    if position.current_player == "w":
+      pawns, opponent = position.board.bitboards["P"], "b"
+    else:
+      pawns, opponent = position.board.bitboards["p"], "w"
+    if not PAWN_ATTACKS[opponent][SQUARE_INDEX[fields[3]]] & pawns:
+      fields[3] = "-"
+  return " ".join(fields[:4])
+
+def moves_key(moves=None, fen=None):
+  '''Returns the position_key after playing long algebraic moves from fen
+  (or the starting position).'''
+  if fen:
+    position = Position(fen)
+  else:
+    position = Position()
+  for move in moves or []:
+    position.move(move)
+  return position_key(position)
+
+class CacheEntry:
+  """A stored analysis and how much search it represents."""
+
+  def __init__(self, analysis, multipv, limit=None):
+    self.analysis = analysis
+    self.multipv = multipv
+    last = analysis.lines.get(1, {})
+    self.depth = analysis.depth()
+    self.nodes = last.get("nodes", 0)
+    self.time = last.get("time", 0)
+    # the reported time of a movetime search can fall just short of it
+    if limit is not None and limit.movetime is not None:
+      self.time = max(self.time, limit.movetime)
+
+  def satisfies(self, limit, multipv=1):
+    '''Whether this entry is at least as good as a search with limit.'''
+    if self.multipv < multipv or self.analysis.bestmove is None:
+      return False
+    if limit.depth is not None and self.depth < limit.depth:
+      return False
+    if limit.nodes is not None and self.nodes < limit.nodes:
+      return False
+    if limit.movetime is not None and self.time < limit.movetime:
+      return False
+    return True
+
+  def better_than(self, other):
+    return (self.depth, self.multipv, self.nodes) > (other.depth, other.multipv, other.nodes)
+
+  def to_json(self):
+    return json.dumps({
+      "bestmove": self.analysis.bestmove,
+      "ponder": self.analysis.ponder,
+      "multipv": self.multipv,
+      "time": self.time,
+      "lines": [self.analysis.lines[number] for number in sorted(self.analysis.lines)],
+    })
+
+  @staticmethod
+  def from_json(text):
+    data = json.loads(text)
+    analysis = Analysis()
+    analysis.bestmove = data["bestmove"]
+    analysis.ponder = data["ponder"]
+    for info in data["lines"]:
+      info["score"] = tuple(info["score"])
+      analysis.add_info(info)
+    entry = CacheEntry(analysis, data["multipv"])
+    entry.time = max(entry.time, data["time"])
+    return entry
+
+class AnalysisCache:
+  """LRU cache of analyses, optionally backed by a SQLite file."""
+
+  def __init__(self, size=100000, path=None):
+    self.size = size
+    self.entries = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.db = None
+    if path:
+      self.db = sqlite3.connect(path)
+      self.db.execute("CREATE TABLE IF NOT EXISTS analyses "
+                      "(key TEXT PRIMARY KEY, depth INTEGER, data TEXT)")
+
+  def get(self, key, limit, multipv=1):
+    '''Returns a cached Analysis covering limit and multipv, or None.'''
+    entry = self._lookup(key)
+    if entry and entry.satisfies(limit, multipv):
+      self.hits += 1
+      analysis = Analysis()
+      analysis.bestmove = entry.analysis.bestmove
+      analysis.ponder = entry.analysis.ponder
+      for number in sorted(entry.analysis.lines)[:multipv]:
+        analysis.add_info(entry.analysis.lines[number])
+      return analysis
+    self.misses += 1
+    return None
+
+  def put(self, key, analysis, multipv=1, limit=None):
+    '''Stores an analysis (searched with limit) unless a better one is
+    already cached.'''
+    entry = CacheEntry(analysis, multipv, limit)
+    current = self._lookup(key)
+    if current and not entry.better_than(current):
+      return
+    self._remember(key, entry)
+    if self.db:
+      self.db.execute("INSERT OR REPLACE INTO analyses (key, depth, data) VALUES (?, ?, ?)",
+                      (key, entry.depth, entry.to_json()))
+      self.db.commit()
+
+  def _lookup(self, key):
+    entry = self.entries.pop(key, None)
+    if entry is None and self.db:
+      row = self.db.execute("SELECT data FROM analyses WHERE key = ?", (key,)).fetchone()
+      if row:
+        entry = CacheEntry.from_json(row[0])
+    if entry is not None:
+      self._remember(key, entry)
+    return entry
+
+  def _remember(self, key, entry):
+    self.entries.pop(key, None)
+    self.entries[key] = entry
+    while len(self.entries) > self.size:
+      self.entries.popitem(last=False)
+
+  def close(self):
+    if self.db:
+      self.db.close()
+      self.db = None
+
+class CachedEngine:
+  """Wraps an Engine (or anything with the same analyse method) so that
+  positions already searched deeply enough are answered from a cache."""
+
+  def __init__(self, engine, cache=None):
+    self.engine = engine
+    self.cache = cache or AnalysisCache()
+
+  def analyse(self, moves=None, limit=None, fen=None, multipv=1):
+    if limit is None:
+      limit = Limit(depth=20)
+    key = moves_key(moves, fen)
+    analysis = self.cache.get(key, limit, multipv)
+    if analysis is None:
+      analysis = self.engine.analyse(moves, limit, fen, multipv)
+      self.cache.put(key, analysis, multipv, limit)
+    return analysis
+
+  def get_two_top_moves(self, moves, limit=None, thinking=None):
+    '''Returns the two best CandidateMoves (None where there are fewer)
+    after moves, searched to limit (a Limit, by default as in analyse).
+    thinking, or a number passed as limit, is a search time in seconds.'''
+    return two_top_moves(self, moves, limit, thinking)
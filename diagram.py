@@ -0,0 +1,110 @@
+'''Diagrams of every ply of a game.
+
+A game is rendered as one animated GIF, one sprite sheet (a grid of
+boards, one per ply) or one PNG per ply. Consecutive frames are drawn
+with BoardRenderer.render_sequence, which only repastes the squares a
+move changed. Whole PGN files are rendered by a pool of worker
+processes, each writing the files of the games in its byte range:
+
+  save_gif(game, "opera.gif", duration=800)
+  for offset, filename, frames, error in render_pgn("twic.pgn", "diagrams"):
+    print filename, frames
+'''
+import os
+import Image
+
+import instrument
+from draw import FONT_FILE, get_renderer
+from position import Position
+from index import scan_game_offsets
+from batch import run_ranges
+
+OUTPUTS = ("gif", "sheet", "png")
+
+def game_placements(game, flip=False):
+  '''Returns the piece placement FENs of the starting position and of
+  every ply of a game, and the error that stopped the replay (or None).'''
+  position = Position()
+  placements = [position.generate_piece_placement_fen(flip)]
+  for move in game.mainline_moves():
+    try:
+      position.move(move)
+    except Exception, err:
+      return placements, "%s (%s)" % (move, err)
+    placements.append(position.generate_piece_placement_fen(flip))
+  return placements, None
+
+def save_gif(game, filename, flip=False, sq_size=64, font_file=FONT_FILE, duration=1000):
+  '''Writes an animated GIF of a game, duration milliseconds per ply.
+  Returns (frames, error).'''
+  placements, error = game_placements(game, flip)
+  renderer = get_renderer(font_file, sq_size)
+  frames = [board.convert('L') for board in renderer.render_sequence(placements)]
+  frames[0].save(filename, save_all=True, append_images=frames[1:], duration=duration, loop=0)
+  return len(frames), error
+
+def save_sprite_sheet(game, filename, columns=8, flip=False, sq_size=64, font_file=FONT_FILE):
+  '''Writes one image holding the boards of every ply, columns boards
+  per row. Returns (frames, error).'''
+  placements, error = game_placements(game, flip)
+  renderer = get_renderer(font_file, sq_size)
+  width, height = renderer.background.size
+  rows = (len(placements) + columns - 1) // columns
+  sheet = Image.new('LA', (width * columns, height * rows), (255, 255))
+  for frame, board in enumerate(renderer.render_sequence(placements)):
+    sheet.paste(board, ((frame % columns) * width, (frame // columns) * height))
+  sheet.convert('RGB').save(filename)
+  return len(placements), error
+
+def save_pngs(game, pattern, flip=False, sq_size=64, font_file=FONT_FILE):
+  '''Writes a PNG per ply named pattern % ply (0 being the starting
+  position). Returns (frames, error).'''
+  placements, error = game_placements(game, flip)
+  renderer = get_renderer(font_file, sq_size)
+  for ply, board in enumerate(renderer.render_sequence(placements)):
+    board.convert('RGB').save(pattern % ply)
+  return len(placements), error
+
+@instrument.timed("diagram")
+def save_game(game, out_dir, name, output="gif", flip=False, sq_size=64, font_file=FONT_FILE):
+  '''Writes the diagrams of a game to out_dir in one of OUTPUTS.
+  Returns (filename, frames, error); for "png" the filename is a pattern.'''
+  if output == "gif":
+    filename = os.path.join(out_dir, "%s.gif" % name)
+    frames, error = save_gif(game, filename, flip, sq_size, font_file)
+  elif output == "sheet":
+    filename = os.path.join(out_dir, "%s.png" % name)
+    frames, error = save_sprite_sheet(game, filename, flip=flip, sq_size=sq_size, font_file=font_file)
+  elif output == "png":
+    filename = os.path.join(out_dir, "%s-%%03d.png" % name)
+    frames, error = save_pngs(game, filename, flip, sq_size, font_file)
+  else:
+    raise ValueError("Unknown diagram output '%s'" % output)
+  return filename, frames, error
+
+def _render_range(args):
+  path, start, end, out_dir, output, flip, sq_size, font_file = args
+  results = []
+  with open(path, "rb") as pgn_file:
+    pgn_file.seek(start)
+    for offset, length, game in scan_game_offsets(pgn_file):
+      if offset >= end:
+        break
+      filename, frames, error = save_game(game, out_dir, "%010i" % offset, output,
+                                          flip, sq_size, font_file)
+      results.append((offset, filename, frames, error))
+  return results
+
+def render_pgn(path, out_dir, output="gif", processes=None, chunk_size=None,
+               flip=False, sq_size=64, font_file=FONT_FILE):
+  '''Renders every game of a PGN file into out_dir using a pool of
+  processes, one file (or PNG series) per game named after the game's
+  byte offset. Yields (offset, filename, frames, error) in file order.'''
+  if output not in OUTPUTS:
+    raise ValueError("Unknown diagram output '%s'" % output)
+  if not os.path.isdir(out_dir):
+    os.makedirs(out_dir)
+  for results in run_ranges(_render_range, path, (out_dir, output, flip, sq_size, font_file),
+                            processes, chunk_size):
+    for result in results:
+      yield result
@@ -24,6 +24,14 @@ import Image
 import ImageDraw
 import ImageFont
 
+FONT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chess_merida_unicode.ttf')
+
+DIGIT = re.compile(r'\d')
+VALID_EXPANDED_FEN = re.compile(r'([KQBNRPkqbnrp ]{8}/){8}$')
+
+UNICHR_PIECES = dict(
+  zip("KQRBNPkqrbnp", (unichr(uc) for uc in range(0x2654, 0x2660))))
+
 class BadChessboard(ValueError):
   def __init__(self, *args):
     # *args is used to get a list of the parameters passed in
@@ -37,12 +45,11 @@ def expand_blanks(fen):
   '''
   def expand(match):
     return ' ' * int(match.group(0))
-  return re.compile(r'\d').sub(expand, fen)
+  return DIGIT.sub(expand, fen)
 
 def check_valid(expanded_fen):
   '''Asserts an expanded FEN string is valid'''
-  match = re.compile(r'([KQBNRPkqbnrp ]{8}/){8}$').match
-  if not match(expanded_fen + '/'):
+  if not VALID_EXPANDED_FEN.match(expanded_fen + '/'):
     raise BadChessboard(expanded_fen)
 
 def expand_fen(fen):
@@ -63,10 +70,13 @@ def draw_board(n=8, sq_size=(20, 20)):
   from itertools import cycle
   def square(i, j):
     return i * sq_size[0], j * sq_size[1]
+  def last_pixel(i, j):
+    # rectangle() includes its end point
+    return (i + 1) * sq_size[0] - 1, (j + 1) * sq_size[1] - 1
   opaque_grey_background = 192, 255
   board = Image.new('LA', square(n, n), opaque_grey_background) 
   draw_square = ImageDraw.Draw(board).rectangle
-  whites = ((square(i, j), square(i + 1, j + 1))
+  whites = ((square(i, j), last_pixel(i, j))
     for i_start, j in zip(cycle((0, 1)), range(n))
     for i in range(i_start, n, 2))
   for white_square in whites:
@@ -80,32 +90,88 @@ def chess_position_using_font(fen, font_file, sq_size):
   font_file - the name of a font file
   sq_size - the size of each square on the chess board
   '''
-  font = ImageFont.truetype(font_file, sq_size)
-  pieces = expand_fen(fen)
-  board = draw_board(sq_size=(sq_size, sq_size))
-  put_piece = ImageDraw.Draw(board).text
-  unichr_pieces=dict(
-    zip("KQRBNPkqrbnp", (unichr(uc) for uc in range(0x2654, 0x2660))))
+  return get_renderer(font_file, sq_size).render(fen)
+
+def draw_piece(image, square, piece, font):
+  '''Draws a piece glyph with its top left corner at square.'''
+  put_piece = ImageDraw.Draw(image).text
+  if piece.upper() == piece:
+    # Use the equivalent black piece, drawn white,
+    # for the 'body' of the piece, so the background
+    # square doesn't show through.
+    filler = UNICHR_PIECES[piece.lower()]
+  else:
+    filler = UNICHR_PIECES[piece.upper()]
+  put_piece(square, filler, fill='white', font=font)
+  put_piece(square, UNICHR_PIECES[piece], fill='black', font=font)
+
+class BoardRenderer:
+  '''Draws chess positions for one font and square size.
+  
+  The font is loaded once, the empty board is drawn once, and every
+  piece is rasterized once on a light and on a dark square into a
+  sprite atlas. Drawing a position then copies the board and pastes a
+  sprite per piece.
+  '''
   
-  def point(i, j):
-    return i * sq_size, j * sq_size
+  def __init__(self, font_file=FONT_FILE, sq_size=64):
+    self.sq_size = sq_size
+    self.font = ImageFont.truetype(font_file, sq_size)
+    self.background = draw_board(sq_size=(sq_size, sq_size))
+    self.atlas, self.sprites = self._build_atlas()
   
-  def not_blank(pt_pce):
-    return pt_pce[1] != ' '
+  def _build_atlas(self):
+    '''Returns the atlas image (a row per square shade, a column per
+    piece) and a dictionary (piece, is_dark_square) -> sprite.'''
+    size = self.sq_size
+    atlas = Image.new('LA', (size * 12, size * 2))
+    light = self.background.crop((0, 0, size, size))
+    dark = self.background.crop((size, 0, size * 2, size))
+    sprites = {}
+    for column, piece in enumerate("KQRBNPkqrbnp"):
+      for row, (is_dark, square) in enumerate([(False, light), (True, dark)]):
+        sprite = square.copy()
+        draw_piece(sprite, (0, 0), piece, self.font)
+        atlas.paste(sprite, (column * size, row * size))
+        sprites[(piece, is_dark)] = sprite
+    sprites[(' ', False)] = light
+    sprites[(' ', True)] = dark
+    return atlas, sprites
   
-  def is_white_piece(piece):
-    return piece.upper() == piece
+  def _paste(self, board, index, piece):
+    i, j = index & 7, index >> 3
+    board.paste(self.sprites[(piece, (i + j) & 1 == 1)], (i * self.sq_size, j * self.sq_size))
   
-  squares = (point(i, j) for j in range(8) for i in range(8))
-  for square, piece in filter(not_blank, zip(squares, pieces)):
-    if is_white_piece(piece):
-      # Use the equivalent black piece, drawn white,
-      # for the 'body' of the piece, so the background
-      # square doesn't show through.
-      filler = unichr_pieces[piece.lower()]
-      put_piece(square, filler, fill='white', font=font)
-    else:
-      filler = unichr_pieces[piece.upper()]
-      put_piece(square, filler, fill='white', font=font)
-    put_piece(square, unichr_pieces[piece], fill='black', font=font)
-  return board
+  def render(self, fen):
+    '''Returns the image of the piece placement part of a FEN.'''
+    pieces = expand_fen(fen)
+    board = self.background.copy()
+    for index, piece in enumerate(pieces):
+      if piece != ' ':
+        self._paste(board, index, piece)
+    return board
+  
+  def render_sequence(self, fens):
+    '''Yields an image per FEN of a sequence, e.g. the plies of a game.
+    
+    Only the squares that differ from the previous FEN are redrawn, so
+    the same image is yielded every time; copy it to keep a frame.
+    '''
+    board = self.background.copy()
+    previous = ' ' * 64
+    for fen in fens:
+      pieces = expand_fen(fen)
+      for index in range(64):
+        if pieces[index] != previous[index]:
+          self._paste(board, index, pieces[index])
+      previous = pieces
+      yield board
+
+_renderers = {}
+
+def get_renderer(font_file=FONT_FILE, sq_size=64):
+  '''Returns the shared BoardRenderer for a font and square size.'''
+  key = (font_file, sq_size)
+  if key not in _renderers:
+    _renderers[key] = BoardRenderer(font_file, sq_size)
+  return _renderers[key]
@@ -1,12 +1,18 @@
 import subprocess
-import time
-import os
-import re
+import threading
+import Queue
+import multiprocessing
 
 from move import *
+from uci import *
 
 class Engine:
-  """Represents a chess engine."""
+  """Represents a chess engine.
+
+  The UCI handshake is done once when the engine is started, and the
+  engine (with its hash table) is reused for every analysis until
+  new_game() is called.
+  """
 
   def __init__(self, engine_path, options={}):
     self.engine = subprocess.Popen(
@@ -14,49 +20,194 @@ class Engine:
       universal_newlines=True,
       stdin=subprocess.PIPE,
       stdout=subprocess.PIPE,
+      bufsize=1,
+      close_fds=True,
     )
-  
-  def get_two_top_moves(self, moves, thinking=10):
+    self.name = None
+    self.options = {}
+    self._multipv = 1
+    self._handshake()
+    for name, value in options.items():
+      self.set_option(name, value)
+    self.wait_ready()
+
+  def _handshake(self):
+    self._put("uci")
+    for line in self._read_until("uciok"):
+      if line.startswith("id name "):
+        self.name = line[len("id name "):]
+      elif line.startswith("option name "):
+        option = parse_option(line)
+        if option:
+          self.options[option[0]] = option[1]
+
+  def new_game(self):
+    '''Tells the engine that the next positions are from a different game.'''
     self._put("ucinewgame")
-    self._get()
-    self._put("position startpos moves %s" % " ".join(moves))
-    self._get()
-    self._put('go infinite')
-    time.sleep(thinking)
-    
-    candidate_moves = [None, None]
-    for line in self._get_lines():
-      matching = re.match(r'.*? score .. (-?\d+) .*? multipv (\d) pv ([^ ]+) ', line)
-      if matching:
-        score = matching.groups()[0]
-        candidate_number = int(matching.groups()[1])
-        move = matching.groups()[2]
-        candidate_moves[candidate_number - 1] = CandidateMove(move, score)
-    
-    self._put('stop')
-    
-    return candidate_moves[0], candidate_moves[1]
-  
+    self.wait_ready()
+
+  def wait_ready(self):
+    self._put("isready")
+    for line in self._read_until("readyok"):
+      pass
+
+  def analyse(self, moves=None, limit=None, fen=None, multipv=1, callback=None):
+    '''Searches a position and returns an Analysis.
+
+    The position is given as a list of long algebraic moves from the
+    starting position (or from fen). The search stops at limit (a Limit)
+    and the engine's own "bestmove" ends the call. callback, if given, is
+    called with every parsed info dictionary as it streams in.
+    '''
+    if limit is None:
+      limit = Limit(depth=20)
+    if multipv != self._multipv:
+      self.set_option("MultiPV", multipv)
+      self._multipv = multipv
+
+    self._put(position_command(moves, fen))
+    self._put(limit.go_command())
+
+    analysis = Analysis()
+    for line in self._read_until("bestmove"):
+      if line.startswith("info "):
+        info = parse_info(line)
+        analysis.add_info(info)
+        if callback:
+          callback(info)
+      elif line.startswith("bestmove"):
+        analysis.bestmove, analysis.ponder = parse_bestmove(line)
+    return analysis
+
+  def get_two_top_moves(self, moves, limit=None, thinking=None):
+    '''Returns the two best CandidateMoves (None where there are fewer)
+    after moves, searched to limit (a Limit, by default as in analyse).
+    thinking, or a number passed as limit, is a search time in seconds.'''
+    return two_top_moves(self, moves, limit, thinking)
+
   def set_option(self, name, value):
     self._put("setoption name %s value %s" % (name, value))
-  
+
+  def quit(self):
+    self._put("quit")
+    self.engine.stdin.close()
+    self.engine.wait()
+
   def _put(self, command):
     self.engine.stdin.write("%s\n" % command)
-  
-  def _get(self):
-    response = ""
-    for line in self._get_lines():
-      response += "\n%s" % line
-    return response
-  
-  def _get_lines(self):
-    # Using the isready command to
-    # know when we've reached the last line
-    # of stdout (engine will answer 'readyok')
-    self.engine.stdin.write('isready\n')
+    self.engine.stdin.flush()
+
+  def _readline(self):
+    # a method of its own so that the time spent waiting on the engine
+    # can be instrumented, see instrument.py
+    return self.engine.stdout.readline()
+
+  def _read_until(self, prefix):
+    '''Yields engine output lines up to and including the first one
+    starting with prefix.'''
     while True:
-      text = self.engine.stdout.readline().strip()
-      if text == 'readyok':
+      text = self._readline()
+      if text == '':
+        raise EOFError("Engine terminated while waiting for '%s'." % prefix)
+      text = text.strip()
+      if text == '':
+        continue
+      yield text
+      if text.startswith(prefix):
         break
-      if text != '':
-        yield text
+
+class EnginePool:
+  """A set of engine processes analysing positions in parallel.
+
+  Each engine gets threads Threads and hash_size MB of Hash; size
+  defaults to one engine per CPU. Engines that crash are restarted.
+  """
+
+  def __init__(self, engine_path, size=None, threads=1, hash_size=16, options={}, retries=1):
+    self.engine_path = engine_path
+    self.size = size or multiprocessing.cpu_count()
+    self.options = dict(options)
+    self.options["Threads"] = threads
+    self.options["Hash"] = hash_size
+    self.retries = retries
+    self.engines = [self._start_engine() for i in range(self.size)]
+
+  def _start_engine(self):
+    return Engine(self.engine_path, self.options)
+
+  def _restart_engine(self, slot):
+    try:
+      self.engines[slot].engine.kill()
+    except OSError:
+      pass
+    self.engines[slot] = self._start_engine()
+
+  def analyse_many(self, positions, limit, multipv=1):
+    '''Analyses positions across the pool, yielding (index, analysis, error)
+    tuples in the order the analyses finish.
+
+    Each position is either a list of long algebraic moves from the
+    starting position or a FEN string. index is the position's place in
+    positions. If an engine crashes it is restarted and the position
+    retried; when that keeps failing, analysis is None and error holds
+    the exception.
+    '''
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+    count = 0
+    for index, position in enumerate(positions):
+      tasks.put((index, position))
+      count += 1
+
+    def work(slot):
+      while True:
+        try:
+          index, position = tasks.get_nowait()
+        except Queue.Empty:
+          return
+        try:
+          result = self._analyse_with_retries(slot, position, limit, multipv, index)
+        except Exception, error:
+          # e.g. the engine could not be restarted; the caller still
+          # gets one result per position instead of waiting forever
+          result = index, None, error
+        results.put(result)
+
+    workers = [threading.Thread(target=work, args=(slot,)) for slot in range(self.size)]
+    for worker in workers:
+      worker.daemon = True
+      worker.start()
+
+    try:
+      for i in range(count):
+        yield results.get()
+    finally:
+      # stop handing out work if the caller stops early
+      while True:
+        try:
+          tasks.get_nowait()
+        except Queue.Empty:
+          break
+      for worker in workers:
+        worker.join()
+
+  def _analyse_with_retries(self, slot, position, limit, multipv, index):
+    if isinstance(position, basestring):
+      moves, fen = None, position
+    else:
+      moves, fen = position, None
+    error = None
+    for attempt in range(self.retries + 1):
+      try:
+        return index, self.engines[slot].analyse(moves, limit, fen, multipv), None
+      except (EOFError, IOError, OSError), err:
+        error = err
+        self._restart_engine(slot)
+    return index, None, error
+
+  def quit(self):
+    for engine in self.engines:
+      try:
+        engine.quit()
+      except (IOError, OSError):
+        pass
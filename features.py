@@ -0,0 +1,157 @@
+'''NumPy encoding of positions as bit planes, e.g. for training models.
+
+A position is encoded as PLANE_COUNT 8x8 planes of 0/1 uint8 values:
+one per piece symbol in PLANE_SYMBOLS, then side to move (all ones when
+white is to move) and one per castling right in CASTLING_RIGHTS.
+plane[rank][file] is the square, so plane[0][0] is a1 and plane[7][7]
+is h8.
+
+The packed form stores each rank of a plane as one byte, bit n being
+file n, which is exactly the layout of the Board bitboards: a packed
+position is PLANE_COUNT x 8 bytes instead of PLANE_COUNT x 64.
+
+  planes = encode_games(games)                      # (positions, 17, 8, 8)
+  packed = encode_games(games, "train.npy", packed=True)
+  planes = unpack_planes(packed[:1024])
+
+Requires NumPy; position.py only imports this module when
+Position.to_planes is called.
+'''
+import struct
+
+import numpy
+
+PLANE_SYMBOLS = "KQRBNPkqrbnp"
+CASTLING_RIGHTS = "KQkq"
+SIDE_PLANE = len(PLANE_SYMBOLS)
+PLANE_COUNT = SIDE_PLANE + 1 + len(CASTLING_RIGHTS)
+
+# positions encoded per vectorized unpacking step
+CHUNK_SIZE = 4096
+
+# bytes of the .npy header written by encode_games, a multiple of 64
+NPY_HEADER_SIZE = 128
+
+def planes_shape(count, packed=False):
+  if packed:
+    return (count, PLANE_COUNT, 8)
+  return (count, PLANE_COUNT, 8, 8)
+
+def unpack_planes(packed):
+  '''Turns packed planes (..., 8) into 0/1 planes (..., 8, 8).'''
+  bits = numpy.unpackbits(packed[..., numpy.newaxis], axis=-1)
+  # unpackbits puts the most significant bit (file h) first
+  return bits[..., ::-1]
+
+def _pack_position(position, words, flags):
+  '''Writes the bitboards of a position into a row of uint64 words and
+  its side to move and castling rights into a row of flag bytes.'''
+  bitboards = position.board.bitboards
+  for plane, symbol in enumerate(PLANE_SYMBOLS):
+    words[plane] = bitboards[symbol]
+  flags[0] = 0xFF if position.current_player == "w" else 0
+  castle_info = position.castle_info
+  for plane, right in enumerate(CASTLING_RIGHTS):
+    flags[plane + 1] = 0xFF if right in castle_info else 0
+
+class _PlaneWriter:
+  """Packs positions a chunk at a time and passes each chunk to write,
+  unpacking it in a single NumPy call if needed."""
+
+  def __init__(self, write, packed):
+    self.write = write
+    self.packed = packed
+    self.rows = 0
+    self.words = numpy.zeros((CHUNK_SIZE, SIDE_PLANE), dtype="<u8")
+    self.flags = numpy.zeros((CHUNK_SIZE, PLANE_COUNT - SIDE_PLANE, 1), dtype=numpy.uint8)
+    self.pending = 0
+
+  def stage(self, position):
+    '''Packs a position into the next row without keeping it yet.'''
+    _pack_position(position, self.words[self.pending], self.flags[self.pending, :, 0])
+
+  def commit(self):
+    '''Keeps the position staged last.'''
+    self.pending += 1
+    if self.pending == CHUNK_SIZE:
+      self.flush()
+
+  def add(self, position):
+    self.stage(position)
+    self.commit()
+
+  def flush(self):
+    count = self.pending
+    if not count:
+      return
+    chunk = numpy.empty((count, PLANE_COUNT, 8), dtype=numpy.uint8)
+    chunk[:, :SIDE_PLANE] = self.words[:count].view(numpy.uint8).reshape(count, SIDE_PLANE, 8)
+    chunk[:, SIDE_PLANE:] = self.flags[:count]
+    if not self.packed:
+      chunk = unpack_planes(chunk)
+    self.write(chunk)
+    self.rows += count
+    self.pending = 0
+
+def position_planes(position, packed=False):
+  '''Returns the planes of a Position, see the module documentation.'''
+  chunks = []
+  writer = _PlaneWriter(chunks.append, packed)
+  writer.add(position)
+  writer.flush()
+  return chunks[0][0]
+
+def npy_header(shape):
+  '''Returns a version 1.0 .npy header for a uint8 array of shape. It is
+  always NPY_HEADER_SIZE bytes, so the header of a file being appended to
+  can be rewritten once the number of rows is known.'''
+  magic = numpy.lib.format.magic(1, 0)
+  header = repr({"descr": "|u1", "fortran_order": False, "shape": tuple(shape)})
+  padding = NPY_HEADER_SIZE - len(magic) - 2 - len(header) - 1
+  return magic + struct.pack("<H", len(header) + padding + 1) + header + " " * padding + "\n"
+
+def encode_games(games, path=None, packed=False):
+  '''Replays games and returns the planes of the position before every
+  move, in game order, as an array of planes_shape(positions, packed).
+
+  games may be any iterable and is consumed one game at a time. With a
+  path the planes are appended to a .npy file chunk by chunk and the
+  returned array is that file memory-mapped (numpy.load(path,
+  mmap_mode="r") reopens it), so datasets larger than memory can be
+  written. A game stops at its first illegal move.
+  '''
+  from position import Position
+
+  if path:
+    out_file = open(path, "wb")
+    out_file.write(npy_header(planes_shape(0, packed)))
+    write = lambda chunk: out_file.write(numpy.ascontiguousarray(chunk).tobytes())
+  else:
+    chunks = []
+    write = chunks.append
+  writer = _PlaneWriter(write, packed)
+  try:
+    for game in games:
+      position = Position()
+      try:
+        for move in game.mainline_moves():
+          writer.stage(position)
+          position.move(move)
+          writer.commit()
+      except Exception:
+        pass
+    writer.flush()
+  finally:
+    if path:
+      out_file.seek(0)
+      out_file.write(npy_header(planes_shape(writer.rows, packed)))
+      out_file.close()
+  shape = planes_shape(writer.rows, packed)
+  if not path:
+    if not chunks:
+      return numpy.zeros(shape, dtype=numpy.uint8)
+    return numpy.concatenate(chunks)
+  if not writer.rows:
+    # an empty array cannot be memory-mapped
+    return numpy.load(path)
+  return numpy.load(path, mmap_mode="r+")
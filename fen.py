@@ -0,0 +1,78 @@
+'''FEN encoding and decoding on the Board array.
+
+The piece placement of a board is kept as one FEN string per rank.
+Board forgets the string of a rank when a piece is put on, removed from
+or moved on it, so after a move only the one or two ranks the move
+touched are encoded again and the other six or seven are reused. Rank
+strings are interned, so the "8"s and "pppppppp"s of millions of
+positions share their memory.
+
+  for fen in fens_for_game(game):
+    print fen
+'''
+
+EMPTY_RUNS = dict((str(count), count) for count in range(1, 9))
+EMPTY_TEXT = [""] + [str(count) for count in range(1, 9)]
+
+def rank_fen(squares, rank):
+  '''Returns the FEN of rank (0 for the first rank) of a squares array.'''
+  text = ""
+  empty = 0
+  for piece in squares[rank * 8:rank * 8 + 8]:
+    if piece is None:
+      empty += 1
+    else:
+      if empty:
+        text += EMPTY_TEXT[empty]
+        empty = 0
+      text += piece.symbol
+  if empty:
+    text += EMPTY_TEXT[empty]
+  return intern(text)
+
+def placement_fen(board):
+  '''Returns the piece placement field of the FEN of a Board, encoding
+  only the ranks that changed since the last call.'''
+  if board.placement is None:
+    ranks = board.rank_fens
+    for rank in range(8):
+      if ranks[rank] is None:
+        ranks[rank] = rank_fen(board.squares, rank)
+    board.placement = "/".join(ranks[::-1])
+  return board.placement
+
+def flip_placement(placement):
+  '''Returns a placement as seen from black: rank 1 first, files h to a.'''
+  return placement[::-1]
+
+def parse_placement(placement):
+  '''Returns [(symbol, square index)] for the pieces of a FEN piece
+  placement such as "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR".'''
+  pieces = []
+  rank = 7
+  for rank_text in placement.split("/"):
+    index = rank * 8
+    for char in rank_text:
+      run = EMPTY_RUNS.get(char)
+      if run:
+        index += run
+      else:
+        pieces.append((char, index))
+        index += 1
+    rank -= 1
+  return pieces
+
+def fens_for_game(game, fen=None):
+  '''Yields the FEN after every ply of a game, replayed from fen, the
+  game's FEN tag or the starting position. An illegal move raises as in
+  Position.move.'''
+  from position import Position
+
+  fen = fen or game.attributes.get("fen")
+  if fen:
+    position = Position(fen)
+  else:
+    position = Position()
+  for move in game.mainline_moves():
+    position.move(move)
+    yield position.generate_fen()
@@ -1,9 +1,9 @@
 # Credit to Renato de Pontes Pereira, renato.ppontes at gmail dot com
 # for py pgn parser
 
-import re
 import pdb
-from position import Position
+from position import Position, MoveError
+from pgn import *
 
 class Game:
   """Represents a game."""
@@ -19,15 +19,19 @@ class Game:
   def get_attribute(self, name):
     return self.attributes[name]
   
+  def mainline_moves(self):
+    """Returns the moves of the game without comments and the result."""
+    return [move for move in self.moves if not move.startswith('{') and move not in RESULTS]
+  
   def generate_long_algebraic_moves(self):
     position = Position()
-    for move in self.moves:
+    for move in self.mainline_moves():
       try:
         long_move = "%s%s%s" % position.move(move)
         if len(long_move) > 0:
           yield long_move
       except Exception, err:
-        raise BaseException("Could not process move %s (%s)" % (move, err))
+        raise MoveError("Could not process move %s (%s)" % (move, err))
     
   def ply_count(self):
     count = len(self.moves)
@@ -35,6 +39,11 @@ class Game:
       count -= 1
     return count
   
+  def estimated_ply_count(self):
+    """Returns the number of mainline plies; a LazyGame estimates it from
+    its raw movetext without parsing."""
+    return len(self.mainline_moves())
+  
   def to_pgn(self):
     response = ""
     
@@ -68,37 +77,46 @@ class Game:
       response += move
     return response
   
+  def to_bytes(self, table=None):
+    """Returns the game in the compact binary encoding of gamefile.py.
+    
+    Strings are interned into table (a gamefile.StringTable) if given,
+    otherwise the bytes stand alone.
+    """
+    from gamefile import encode_game
+    return encode_game(self, table)
+  
+  @staticmethod
+  def from_bytes(data, table=None):
+    """Returns the Game encoded by Game.to_bytes with the same table."""
+    from gamefile import decode_game
+    return decode_game(data, table)
+  
   @staticmethod
   def parse_tag(token):
     """Parse a tag token and returns a tuple with (name, value)."""
-    tag, value = re.match(r'\[(\w*)\s*(.+)', token).groups()
-    return tag.lower(), value.strip('"[] ')
+    return parse_tag(token)
   
   @staticmethod
   def parse_moves(token):
-    """Parse a moves token and returns a list with movements."""
+    """Parse a moves token and returns a list with movements.
+    
+    Comments are kept as "{...}" entries and the result, if any, is the
+    last entry. Variations and NAGs are skipped.
+    """
     moves = []
-    while token:
-      token = re.sub(r'^\s*(\d+\.+\s*)?', '', token)
-      
-      if token.startswith('{'):
-        pos = token.find('}')+1
-      else:
-        pos1 = token.find(' ')
-        pos2 = token.find('{')
-        if pos1 <= 0:
-          pos = pos2
-        elif pos2 <= 0:
-          pos = pos1
-        else:
-          pos = min([pos1, pos2])
-      
-      if pos > 0:
-        moves.append(token[:pos])
-        token = token[pos:]
+    depth = 0
+    for kind, value in tokenize_movetext(token):
+      if kind == VARIATION_START:
+        depth += 1
+      elif kind == VARIATION_END:
+        depth = max(depth - 1, 0)
+      elif depth or kind == NAG:
+        continue
+      elif kind == COMMENT:
+        moves.append("{%s}" % value)
       else:
-        moves.append(token)
-        token = ''
+        moves.append(value)
     
     return moves
 
@@ -158,33 +176,131 @@ class Game:
     return token.strip()
 
   @staticmethod
-  def games_from_pgn(pgn_file):
-    """Returns an array of Games from a PGN file."""
-    games = []
-    game = None
+  def games_from_pgn(pgn_file, lazy=False):
+    """Returns an array of Games from a PGN file.
     
-    # Preprocess, remove comments
-    lines = []
-    for line in pgn_file.readlines():
-      line = re.sub(r'\s*(\\r)?\\n\s*', '\n', line.strip())
-      if line:
-        lines.append(line)
+    With lazy the file is read into one buffer shared by all the games,
+    which are LazyGames parsing their moves on first use.
+    """
+    if not lazy:
+      return list(Game.iter_games(pgn_file))
+    if hasattr(pgn_file, "read"):
+      data = pgn_file.read()
+    else:
+      data = "\n".join(line.rstrip("\r\n") for line in pgn_file)
+    return list(Game.iter_lazy_games(data))
 
-    while True:
-      token = Game.next_token(lines)
-      
-      if not token:
-        break
+  @staticmethod
+  def iter_lazy_games(data, predicate=None):
+    """Yields a LazyGame for every game of PGN text in a string or mmap.
+    
+    Only the tags are parsed; the games keep slices of data for their
+    movetext. predicate, as for iter_headers, skips games by their tags.
+    """
+    for offset, tags, start, end in scan_games(data, predicate):
+      yield LazyGame(data, start, end, tags)
+
+  @staticmethod
+  def iter_headers(pgn_file, predicate=None):
+    """Yields a HeaderRecord (tags and byte offset) for every game of a PGN
+    file opened in binary mode, skipping the movetext unparsed.
+    
+    predicate, if given, is called with the tags dictionary of each game
+    and only matching games are yielded, e.g.
+    
+      Game.iter_headers(pgn_file, lambda tags: tags.get("date", "").startswith("2013"))
+    """
+    return scan_headers(pgn_file, predicate)
+
+  @staticmethod
+  def load_at(pgn_file, offset):
+    """Returns the game starting at byte offset of a PGN file (or mmap)."""
+    pgn_file.seek(offset)
+    for game in Game.iter_games(iter(pgn_file.readline, '')):
+      return game
+
+  @staticmethod
+  def iter_games(pgn_file):
+    """Yields the Games of a PGN file one at a time.
+    
+    The file is read line by line and only the game being parsed is kept
+    in memory, so arbitrarily large files can be processed. Games are
+    split by the rule of pgn.scan_games.
+    """
+    game = None
+    movetext = []
+    
+    for line in pgn_file:
+      line = line.strip()
+      if not line or line.startswith('%'):
+        continue
       
-      if token.startswith('['):
-        tag_name, value = Game.parse_tag(token)
+      if line.startswith('['):
+        if movetext:
+          game.moves = Game.parse_moves('\n'.join(movetext))
+          movetext = []
+          yield game
+          game = None
         
-        if not game or (game and game.moves):
+        if not game:
           game = Game()
-          games.append(game)
         
+        tag_name, value = Game.parse_tag(line)
         game.set_attribute(tag_name, value)
       else:
-        game.moves = Game.parse_moves(token)
+        if not game:
+          game = Game()
+        movetext.append(line)
     
-    return games
+    if game:
+      if movetext:
+        game.moves = Game.parse_moves('\n'.join(movetext))
+      yield game
+
+
+class LazyGame(Game):
+  """A Game whose movetext is parsed on first access of moves.
+  
+  The game holds the buffer it was read from, usually shared by all the
+  games of a file, and the range of its movetext in it. Jobs that only
+  look at the tags or at estimated_ply_count never parse the moves.
+  """
+
+  def __init__(self, buffer="", start=0, end=None, attributes=None):
+    self.attributes = attributes or {}
+    self.buffer = buffer
+    self.start = start
+    if end is None:
+      end = len(buffer)
+    self.end = end
+
+  def __getattr__(self, name):
+    if name != "moves":
+      raise AttributeError(name)
+    self.moves = Game.parse_moves(self.movetext())
+    return self.moves
+
+  def __getstate__(self):
+    # pickle only the own movetext, not the whole shared buffer
+    state = dict(self.__dict__)
+    state["buffer"] = self.buffer[self.start:self.end]
+    state["start"] = 0
+    state["end"] = len(state["buffer"])
+    return state
+
+  def is_parsed(self):
+    return "moves" in self.__dict__
+
+  def movetext(self):
+    """Returns the raw movetext of the game."""
+    text = self.buffer[self.start:self.end]
+    if "{" in text or ";" in text or "%" in text or "\r" in text:
+      # the lines as iter_games reads them, which comments keep
+      lines = (line.strip() for line in text.split("\n"))
+      text = "\n".join(line for line in lines if line and not line.startswith("%"))
+    return text
+
+  def estimated_ply_count(self):
+    if self.is_parsed():
+      return Game.estimated_ply_count(self)
+    return estimate_ply_count(self.movetext())
@@ -0,0 +1,272 @@
+'''Compact binary storage of games.
+
+A game is encoded as its tags and its move list (SAN moves, "{comment}"
+entries and the result, as in Game.moves). Every string is a reference
+to a StringTable: tag names, common tag values and moves are interned,
+so a move usually takes a single byte and a repeated event name or
+player takes one or two. Comments are written inline. Decoding is a
+table lookup per token with no parsing and no replaying, and the
+decoded game holds exactly the tags and moves that were encoded, so
+Game.to_pgn gives the same text.
+
+A game file holds the encoded games followed by the string table and
+the offset of every game, which a reader loads once:
+
+  convert_pgn("twic.pgn", "twic.games")
+  games = GameFile("twic.games")
+  game = games.get(123)
+  headers = games.headers(123)       # the tags only, moves not decoded
+'''
+import mmap
+import re
+import struct
+
+from game import Game
+
+MAGIC = "CBGF"
+VERSION = 1
+# magic, version, offset of the string table and game offsets
+FILE_HEADER = struct.Struct("<4sBxxxQ")
+# inline strings are written after this reference
+INLINE = 0
+INLINE_BYTE = chr(INLINE)
+# one encoded varint
+VARINT = re.compile(r'[\x80-\xff]*[\x00-\x7f]')
+
+def write_varint(out, value):
+  '''Appends an unsigned LEB128 integer to a bytearray.'''
+  while value >= 0x80:
+    out.append((value & 0x7F) | 0x80)
+    value >>= 7
+  out.append(value)
+
+def read_varint(data, pos):
+  '''Returns (value, next position) of the varint at pos of a bytearray.'''
+  value = data[pos]
+  pos += 1
+  if value < 0x80:
+    return value, pos
+  value &= 0x7F
+  shift = 7
+  while True:
+    byte = data[pos]
+    pos += 1
+    value |= (byte & 0x7F) << shift
+    if byte < 0x80:
+      return value, pos
+    shift += 7
+
+class StringTable:
+  """Interned strings, referred to by their position + 1."""
+
+  def __init__(self, strings=None):
+    self.strings = [None]
+    self.indexes = {}
+    self._codes = {}
+    for string in strings or []:
+      self.intern(string)
+
+  def intern(self, string):
+    index = self.indexes.get(string)
+    if index is None:
+      index = self.indexes[string] = len(self.strings)
+      self.strings.append(string)
+    return index
+
+  def __len__(self):
+    return len(self.strings) - 1
+
+  def codes(self):
+    '''Returns a dictionary from encoded reference to string.'''
+    if len(self._codes) != len(self):
+      for index in xrange(len(self._codes) + 1, len(self.strings)):
+        code = bytearray()
+        write_varint(code, index)
+        self._codes[bytes(code)] = self.strings[index]
+    return self._codes
+
+  def to_bytes(self):
+    out = bytearray()
+    write_varint(out, len(self))
+    for string in self.strings[1:]:
+      write_varint(out, len(string))
+      out.extend(string)
+    return out
+
+  @staticmethod
+  def from_bytes(data, pos=0):
+    '''Returns (table, next position) for a table written by to_bytes.'''
+    data = bytearray(data)
+    table = StringTable()
+    count, pos = read_varint(data, pos)
+    for i in xrange(count):
+      length, pos = read_varint(data, pos)
+      table.intern(str(data[pos:pos + length]))
+      pos += length
+    return table, pos
+
+def _write_string(out, string, table, intern):
+  if table is not None:
+    index = table.indexes.get(string)
+    if index is None and intern:
+      index = table.intern(string)
+    if index is not None:
+      write_varint(out, index)
+      return
+  out.append(INLINE)
+  write_varint(out, len(string))
+  out.extend(string)
+
+def _read_strings(data, pos, count, strings):
+  '''Returns ([count strings], next position) read from a bytearray.'''
+  values = []
+  append = values.append
+  for i in xrange(count):
+    index = data[pos]
+    pos += 1
+    if index >= 0x80:
+      index, pos = read_varint(data, pos - 1)
+    if index:
+      append(strings[index])
+    else:
+      length, pos = read_varint(data, pos)
+      append(str(data[pos:pos + length]))
+      pos += length
+  return values, pos
+
+def encode_game(game, table=None, intern=True):
+  '''Returns the bytes of a game.
+
+  Strings found in table are written as references; with intern the
+  others (but comments) are added to it, otherwise they are inline.
+  Without a table everything is inline and the bytes stand alone.
+  '''
+  out = bytearray()
+  tags = game.attributes.items()
+  write_varint(out, len(tags))
+  for name, value in tags:
+    _write_string(out, name, table, intern)
+    _write_string(out, value, table, intern)
+  write_varint(out, len(game.moves))
+  for move in game.moves:
+    _write_string(out, move, table, intern and not move.startswith('{'))
+  return bytes(out)
+
+def decode_tags(data, table=None, pos=0):
+  '''Returns (tags, next position) of a game encoded at pos of a bytearray.'''
+  strings = table.strings if table is not None else [None]
+  count, pos = read_varint(data, pos)
+  values, pos = _read_strings(data, pos, count * 2, strings)
+  return dict(zip(values[::2], values[1::2])), pos
+
+def decode_game(data, table=None):
+  '''Returns the Game encoded in data with encode_game.'''
+  game = Game()
+  data = bytes(data)
+  if table is not None and INLINE_BYTE not in data:
+    # every string is a reference, so the record splits into varints
+    # that are looked up without a loop over the bytes
+    codes = table.codes()
+    tokens = VARINT.findall(data)
+    tags_end = 1 + 2 * read_varint(bytearray(tokens[0]), 0)[0]
+    values = [codes[code] for code in tokens[1:tags_end]]
+    game.attributes = dict(zip(values[::2], values[1::2]))
+    game.moves = [codes[code] for code in tokens[tags_end + 1:]]
+    return game
+  data = bytearray(data)
+  game.attributes, pos = decode_tags(data, table)
+  count, pos = read_varint(data, pos)
+  strings = table.strings if table is not None else [None]
+  game.moves, pos = _read_strings(data, pos, count, strings)
+  return game
+
+class GameFileWriter:
+  """Writes games to a new game file."""
+
+  def __init__(self, path):
+    self.file = open(path, "wb")
+    self.file.write(FILE_HEADER.pack(MAGIC, VERSION, 0))
+    self.table = StringTable()
+    self.offsets = []
+
+  def add(self, game):
+    self.offsets.append(self.file.tell())
+    self.file.write(encode_game(game, self.table))
+
+  def close(self):
+    '''Writes the string table and game offsets and closes the file.'''
+    trailer_offset = self.file.tell()
+    self.file.write(self.table.to_bytes())
+    self.file.write(struct.pack("<Q", len(self.offsets)))
+    self.file.write(struct.pack("<%iQ" % len(self.offsets), *self.offsets))
+    self.file.seek(0)
+    self.file.write(FILE_HEADER.pack(MAGIC, VERSION, trailer_offset))
+    self.file.close()
+
+class GameFile:
+  """Random access to the games of a game file."""
+
+  def __init__(self, path):
+    self.path = path
+    self._file = open(path, "rb")
+    self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, trailer_offset = FILE_HEADER.unpack(self._map[:FILE_HEADER.size])
+    if magic != MAGIC or version != VERSION:
+      raise ValueError("%s is not a version %i game file" % (path, VERSION))
+    trailer = bytearray(self._map[trailer_offset:])
+    self.table, pos = StringTable.from_bytes(trailer)
+    count, = struct.unpack("<Q", bytes(trailer[pos:pos + 8]))
+    self.offsets = list(struct.unpack("<%iQ" % count, bytes(trailer[pos + 8:pos + 8 + 8 * count])))
+    self.offsets.append(trailer_offset)
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def raw(self, n):
+    '''Returns the encoded bytes of game n (0 based).'''
+    return self._map[self.offsets[n]:self.offsets[n + 1]]
+
+  def get(self, n):
+    '''Decodes and returns game n (0 based).'''
+    return decode_game(self.raw(n), self.table)
+
+  def headers(self, n):
+    '''Returns the tags of game n without decoding its moves.'''
+    return decode_tags(bytearray(self.raw(n)), self.table)[0]
+
+  def __iter__(self):
+    for n in xrange(len(self)):
+      yield self.get(n)
+
+  def find(self, **tags):
+    '''Returns the numbers of the games whose tags equal the given values,
+    e.g. games.find(white="Carlsen, Magnus").'''
+    return [n for n in xrange(len(self))
+            if all(self.headers(n).get(tag) == value for tag, value in tags.items())]
+
+  def close(self):
+    if self._map is not None:
+      self._map.close()
+      self._file.close()
+      self._map = None
+      self._file = None
+
+def convert_pgn(pgn_path, path):
+  '''Writes the games of a PGN file to a game file. Returns the number of
+  games.'''
+  writer = GameFileWriter(path)
+  with open(pgn_path, "rb") as pgn_file:
+    for game in Game.iter_games(pgn_file):
+      writer.add(game)
+  writer.close()
+  return len(writer.offsets)
+
+def export_pgn(path, out_file):
+  '''Writes the games of a game file to out_file as PGN (Game.to_pgn).'''
+  games = GameFile(path)
+  try:
+    for game in games:
+      out_file.write(game.to_pgn())
+      out_file.write("\n\n")
+  finally:
+    games.close()
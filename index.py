@@ -0,0 +1,122 @@
+'''Byte-offset index of the games in a PGN file.
+
+The index records the offset, length and a few key tags of every game
+and is saved as a tab separated sidecar file next to the PGN
+("games.pgn.idx"), so a single game can be loaded without parsing the
+rest of the file:
+
+  index = PgnIndex.open("games.pgn")
+  game = index.get(123456)
+'''
+import mmap
+import os
+
+from game import Game, LazyGame
+from pgn import read_buffer, scan_games
+
+INDEX_TAGS = ["white", "black", "date", "eco", "result"]
+INDEX_SUFFIX = ".idx"
+
+class IndexEntry:
+  """The location and key tags of one game in a PGN file."""
+
+  def __init__(self, offset, length, tags):
+    self.offset = offset
+    self.length = length
+    self.tags = tags
+
+  def get(self, tag, default=None):
+    return self.tags.get(tag, default)
+
+def scan_game_offsets(pgn_file):
+  '''Yields (offset, length, game) for every game of a binary PGN file,
+  from its current position.
+
+  The games are LazyGames sharing one mapping of the file; where a game
+  begins and ends is decided by pgn.scan_games.
+  '''
+  data, start = read_buffer(pgn_file)
+  for offset, tags, movetext_start, movetext_end in scan_games(data, start=start):
+    yield offset, movetext_end - offset, LazyGame(data, movetext_start, movetext_end, tags)
+
+class PgnIndex:
+  """Random access to the games of a PGN file."""
+
+  def __init__(self, pgn_path, entries):
+    self.pgn_path = pgn_path
+    self.entries = entries
+    self._file = None
+    self._map = None
+
+  @staticmethod
+  def build(pgn_path, tags=INDEX_TAGS):
+    '''Scans a PGN file and returns its index.'''
+    entries = []
+    with open(pgn_path, "rb") as pgn_file:
+      for offset, length, game in scan_game_offsets(pgn_file):
+        entry_tags = dict((name, value) for name, value in game.attributes.items() if name in tags)
+        entries.append(IndexEntry(offset, length, entry_tags))
+    return PgnIndex(pgn_path, entries)
+
+  @staticmethod
+  def index_path(pgn_path):
+    return pgn_path + INDEX_SUFFIX
+
+  @staticmethod
+  def load(pgn_path, index_path=None):
+    '''Reads the sidecar index of a PGN file.'''
+    entries = []
+    with open(index_path or PgnIndex.index_path(pgn_path), "r") as index_file:
+      tags = index_file.readline().rstrip("\n").split("\t")[2:]
+      for line in index_file:
+        fields = line.rstrip("\n").split("\t")
+        entry_tags = dict((tag, value) for tag, value in zip(tags, fields[2:]) if value)
+        entries.append(IndexEntry(int(fields[0]), int(fields[1]), entry_tags))
+    return PgnIndex(pgn_path, entries)
+
+  @staticmethod
+  def open(pgn_path):
+    '''Loads the sidecar index of a PGN file, building and saving it if needed.'''
+    index_path = PgnIndex.index_path(pgn_path)
+    if (os.path.exists(index_path) and
+        os.path.getmtime(index_path) >= os.path.getmtime(pgn_path)):
+      return PgnIndex.load(pgn_path, index_path)
+    index = PgnIndex.build(pgn_path)
+    index.save(index_path)
+    return index
+
+  def save(self, index_path=None, tags=INDEX_TAGS):
+    with open(index_path or PgnIndex.index_path(self.pgn_path), "w") as index_file:
+      index_file.write("\t".join(["offset", "length"] + tags) + "\n")
+      for entry in self.entries:
+        values = [entry.get(tag, "").replace("\t", " ") for tag in tags]
+        index_file.write("\t".join([str(entry.offset), str(entry.length)] + values) + "\n")
+
+  def __len__(self):
+    return len(self.entries)
+
+  def raw(self, n):
+    '''Returns the PGN text of game n (0 based).'''
+    entry = self.entries[n]
+    if self._map is None:
+      self._file = open(self.pgn_path, "rb")
+      self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    return self._map[entry.offset:entry.offset + entry.length]
+
+  def get(self, n):
+    '''Parses and returns game n (0 based).'''
+    for game in Game.iter_lazy_games(self.raw(n)):
+      return game
+
+  def find(self, **tags):
+    '''Returns the numbers of the games whose tags equal the given values,
+    e.g. index.find(white="Carlsen, Magnus").'''
+    return [n for n, entry in enumerate(self.entries)
+            if all(entry.get(tag) == value for tag, value in tags.items())]
+
+  def close(self):
+    if self._map is not None:
+      self._map.close()
+      self._file.close()
+      self._map = None
+      self._file = None
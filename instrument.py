@@ -0,0 +1,246 @@
+'''Opt-in timing of the hot paths.
+
+enable() wraps the methods listed in HOOKS so that every call is
+counted and timed into a per-stage histogram, and disable() puts the
+original methods back, so nothing is measured (or slowed down) unless
+instrumentation was asked for:
+
+  instrument.enable()
+  for result in batch.process_pgn("twic.pgn"):
+    pass
+  instrument.dump()
+
+  parse           1000 calls   0.052 s   52 us mean   p50 < 64 us   p99 < 128 us   max 210 us
+  replay         33000 calls   1.210 s ...
+
+Any block of code can be timed as a stage of its own, and callbacks
+receive (stage, seconds) for every timed call:
+
+  with instrument.stage("load"):
+    games = Game.games_from_pgn(pgn_file)
+
+  instrument.add_callback(lambda stage, seconds: seconds > 1 and log(stage))
+
+  with instrument.profile("replay.prof"):
+    replay_everything()
+
+Worker processes started after enable() are instrumented too;
+batch.run_ranges, which runs the pools of replay, openings, search and
+diagrams, sends their statistics back with the results (see collect
+and merge) and profiles them while profile() runs.
+'''
+import contextlib
+import cProfile
+import functools
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+
+# stage, module, class, method
+HOOKS = [
+  ("parse", "game", "Game", "parse_moves"),
+  ("replay", "position", "Position", "move"),
+  ("san", "position", "Position", "get_piece"),
+  ("fen", "position", "Position", "generate_fen"),
+  ("render", "draw", "BoardRenderer", "render"),
+  ("engine.search", "engine", "Engine", "analyse"),
+  ("engine.wait", "engine", "Engine", "_readline"),
+]
+
+enabled = False
+stats = {}
+callbacks = []
+_originals = []
+# while profile() runs: where worker processes write their profiles
+_profile_dir = None
+_worker_profiler = None
+
+class StageStats:
+  """Call count, total time and a histogram of the call times of a stage.
+
+  Bucket n counts the calls that took less than 2 ** n microseconds
+  (and at least 2 ** (n - 1)).
+  """
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+    self.buckets = [0] * 40
+
+  def add(self, seconds):
+    self.count += 1
+    self.total += seconds
+    if seconds > self.max:
+      self.max = seconds
+    self.buckets[min(int(seconds * 1000000).bit_length(), 39)] += 1
+
+  def merge(self, other):
+    self.count += other.count
+    self.total += other.total
+    self.max = max(self.max, other.max)
+    for bucket, count in enumerate(other.buckets):
+      self.buckets[bucket] += count
+
+  def percentile(self, fraction):
+    '''Returns the upper bound in seconds of the bucket holding the
+    fraction (e.g. 0.99) of the calls.'''
+    seen = 0
+    for bucket, count in enumerate(self.buckets):
+      seen += count
+      if seen >= fraction * self.count:
+        return (1 << bucket) / 1000000.0
+    return self.max
+
+def record(name, seconds):
+  '''Adds a call of seconds to a stage.'''
+  stage_stats = stats.get(name)
+  if stage_stats is None:
+    stage_stats = stats[name] = StageStats()
+  stage_stats.add(seconds)
+  for callback in callbacks:
+    callback(name, seconds)
+
+def timed(name):
+  '''Decorator recording every call of a function as stage name while
+  instrumentation is enabled.'''
+  def decorate(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      if not enabled:
+        return function(*args, **kwargs)
+      start = time.time()
+      try:
+        return function(*args, **kwargs)
+      finally:
+        record(name, time.time() - start)
+    wrapper.instrumented = function
+    return wrapper
+  return decorate
+
+@contextlib.contextmanager
+def stage(name):
+  '''Context manager recording the time spent in a block as stage name
+  while instrumentation is enabled.'''
+  start = time.time()
+  try:
+    yield
+  finally:
+    if enabled:
+      record(name, time.time() - start)
+
+@contextlib.contextmanager
+def profile(path=None, sort="cumulative", limit=30):
+  '''Context manager running a block under cProfile. The statistics are
+  written to path (for pstats) or, without a path, the top functions are
+  printed to stderr. Jobs run in worker processes by batch.run_ranges
+  meanwhile are profiled too (see worker_profile) and merged in.'''
+  global _profile_dir
+  _profile_dir = tempfile.mkdtemp(prefix="profile-")
+  profiler = cProfile.Profile()
+  profiler.enable()
+  try:
+    yield profiler
+  finally:
+    profiler.disable()
+    try:
+      profile_stats = pstats.Stats(profiler, stream=sys.stderr)
+      for name in sorted(os.listdir(_profile_dir)):
+        profile_stats.add(os.path.join(_profile_dir, name))
+      if path:
+        profile_stats.dump_stats(path)
+      else:
+        profile_stats.sort_stats(sort).print_stats(limit)
+    finally:
+      shutil.rmtree(_profile_dir, ignore_errors=True)
+      _profile_dir = None
+
+@contextlib.contextmanager
+def worker_profile():
+  '''Context manager profiling a block in a worker process while the
+  parent runs profile(). The profile of all the blocks run by a process
+  so far is written to a file of its own for the parent to merge.'''
+  global _worker_profiler
+  if _profile_dir is None:
+    yield
+    return
+  if _worker_profiler is None:
+    _worker_profiler = cProfile.Profile()
+  _worker_profiler.enable()
+  try:
+    yield
+  finally:
+    _worker_profiler.disable()
+    _worker_profiler.dump_stats(os.path.join(_profile_dir, "%i.prof" % os.getpid()))
+
+def init_worker():
+  '''Starts a forked worker process without the statistics or the
+  profiler it inherited from its parent.'''
+  reset()
+  sys.setprofile(None)
+
+def add_callback(callback):
+  '''Calls callback(stage, seconds) after every recorded call.'''
+  callbacks.append(callback)
+
+def remove_callback(callback):
+  callbacks.remove(callback)
+
+def enable():
+  '''Starts timing the HOOKS stages.'''
+  global enabled
+  if enabled:
+    return
+  for name, module_name, class_name, method_name in HOOKS:
+    cls = getattr(__import__(module_name), class_name)
+    original = cls.__dict__[method_name]
+    if isinstance(original, staticmethod):
+      wrapped = staticmethod(timed(name)(original.__func__))
+    else:
+      wrapped = timed(name)(original)
+    _originals.append((cls, method_name, original))
+    setattr(cls, method_name, wrapped)
+  enabled = True
+
+def disable():
+  '''Puts the original methods back; the statistics are kept.'''
+  global enabled
+  while _originals:
+    cls, method_name, original = _originals.pop()
+    setattr(cls, method_name, original)
+  enabled = False
+
+def reset():
+  stats.clear()
+
+def collect():
+  '''Returns the statistics gathered so far and clears them, or None
+  when disabled, e.g. to send them from a worker process.'''
+  if not enabled:
+    return None
+  collected = dict(stats)
+  stats.clear()
+  return collected
+
+def merge(collected):
+  '''Adds statistics returned by collect (e.g. in a worker process).'''
+  for name, other in (collected or {}).items():
+    stats.setdefault(name, StageStats()).merge(other)
+
+def summary():
+  '''Returns a line of text per stage, slowest stage first.'''
+  lines = []
+  for name, stage_stats in sorted(stats.items(), key=lambda item: -item[1].total):
+    lines.append("%-14s %8i calls %9.3f s %9.0f us mean   p50 < %i us   p99 < %i us   max %.0f us" % (
+      name, stage_stats.count, stage_stats.total,
+      1000000 * stage_stats.total / max(stage_stats.count, 1),
+      1000000 * stage_stats.percentile(0.5), 1000000 * stage_stats.percentile(0.99),
+      1000000 * stage_stats.max))
+  return "\n".join(lines)
+
+def dump(out=None):
+  '''Writes the summary to out (default stderr).'''
+  (out or sys.stderr).write(summary() + "\n")
@@ -0,0 +1,196 @@
+#! /usr/bin/env python
+
+'''chessbox command line.
+
+  python main.py replay games.pgn --processes 8 --fens
+  python main.py --stats --profile replay.prof replay games.pgn
+  python main.py index games.pgn
+  python main.py headers games.pgn --where white=Carlsen --where date=2013
+  python main.py openings games.pgn openings.db --plies 20
+  python main.py search games.pgn games.search --build --material KRvKB
+  python main.py diagrams games.pgn diagrams --output sheet --size 32
+  python main.py pack games.pgn games.bin
+  python main.py explore openings.db "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+'''
+import argparse
+import sys
+
+def replay(args):
+  from batch import process_pgn
+
+  error_count = 0
+  game_count = 0
+  for result in process_pgn(args.pgn, args.processes, with_fens=args.fens):
+    game_count += 1
+    if result.error:
+      error_count += 1
+      print "%i\terror\t%s" % (game_count, result.error)
+      continue
+    print "%i\tmoves\t%s" % (game_count, " ".join(result.long_moves))
+    for fen in result.fens:
+      print "%i\tfen\t%s" % (game_count, fen)
+
+  print >> sys.stderr, "%i games, %i errors" % (game_count, error_count)
+
+def index(args):
+  from index import PgnIndex
+
+  pgn_index = PgnIndex.build(args.pgn)
+  pgn_index.save()
+  print >> sys.stderr, "%i games indexed in %s" % (len(pgn_index), PgnIndex.index_path(args.pgn))
+
+def headers(args):
+  from game import Game
+
+  conditions = [condition.split("=", 1) for condition in args.where]
+  def predicate(tags):
+    for name, value in conditions:
+      if value not in tags.get(name.lower(), ""):
+        return False
+    return True
+
+  with open(args.pgn, "rb") as pgn_file:
+    for record in Game.iter_headers(pgn_file, predicate):
+      tags = " ".join('%s="%s"' % (name, value) for name, value in sorted(record.tags.items()))
+      print "%i\t%s" % (record.offset, tags)
+
+def openings(args):
+  from opening import build_tree_parallel
+
+  tree = build_tree_parallel(args.pgn, args.plies, args.processes)
+  tree.save(args.out)
+  print >> sys.stderr, "%i games, %i errors, %i positions" % (tree.games, tree.errors, len(tree.positions))
+
+def explore(args):
+  from opening import OpeningDatabase
+
+  for stats in OpeningDatabase(args.db).next_moves(args.fen):
+    score = stats.score()
+    elo = stats.average_elo
+    print "%s\t%i\t+%i =%i -%i\t%s\t%s" % (
+      stats.move, stats.games, stats.white_wins, stats.draws, stats.black_wins,
+      score is not None and "%.1f%%" % (100 * score) or "-",
+      elo is not None and "%.0f" % elo or "-")
+
+def search(args):
+  from search import PositionSearch
+
+  if args.build:
+    searcher = PositionSearch.build(args.pgn, args.db, args.processes)
+  else:
+    searcher = PositionSearch(args.db)
+  if args.fen:
+    matches = searcher.find_position(args.fen)
+  elif args.material:
+    matches = searcher.find_material(args.material)
+  else:
+    return
+  for offset, ply in matches:
+    print "%i\t%i" % (offset, ply)
+  print >> sys.stderr, "%i games" % len(matches)
+
+def diagrams(args):
+  from diagram import render_pgn
+
+  game_count = 0
+  error_count = 0
+  for offset, filename, frames, error in render_pgn(args.pgn, args.out, args.output, args.processes,
+                                                    flip=args.flip, sq_size=args.size):
+    game_count += 1
+    if error:
+      error_count += 1
+      print "%i\t%s\t%i\terror\t%s" % (offset, filename, frames, error)
+    else:
+      print "%i\t%s\t%i" % (offset, filename, frames)
+  print >> sys.stderr, "%i games, %i errors" % (game_count, error_count)
+
+def pack(args):
+  from gamefile import convert_pgn
+
+  print >> sys.stderr, "%i games written to %s" % (convert_pgn(args.pgn, args.out), args.out)
+
+def unpack(args):
+  from gamefile import export_pgn
+
+  export_pgn(args.games, sys.stdout)
+
+def build_parser():
+  parser = argparse.ArgumentParser(prog="chessbox")
+  parser.add_argument("--stats", action="store_true",
+                      help="print per-stage call counts and timings to stderr at the end")
+  parser.add_argument("--profile", metavar="FILE", help="run under cProfile, worker processes included, and write the statistics to FILE")
+  commands = parser.add_subparsers()
+
+  command = commands.add_parser("replay", help="replay every game of a PGN file in parallel")
+  command.add_argument("pgn")
+  command.add_argument("--processes", type=int, default=None, help="worker processes (default: CPU count)")
+  command.add_argument("--fens", action="store_true", help="print the FEN after every ply")
+  command.set_defaults(func=replay)
+
+  command = commands.add_parser("index", help="write a byte-offset index of a PGN file")
+  command.add_argument("pgn")
+  command.set_defaults(func=index)
+
+  command = commands.add_parser("headers", help="print the tags of games without parsing their moves")
+  command.add_argument("pgn")
+  command.add_argument("--where", action="append", default=[], metavar="TAG=TEXT",
+                       help="only games whose TAG contains TEXT (repeatable)")
+  command.set_defaults(func=headers)
+
+  command = commands.add_parser("openings", help="build opening explorer statistics from a PGN file")
+  command.add_argument("pgn")
+  command.add_argument("out", help="SQLite file to write")
+  command.add_argument("--plies", type=int, default=20)
+  command.add_argument("--processes", type=int, default=None)
+  command.set_defaults(func=openings)
+
+  command = commands.add_parser("explore", help="list the moves played from a position")
+  command.add_argument("db", help="file written by the openings command")
+  command.add_argument("fen")
+  command.set_defaults(func=explore)
+
+  command = commands.add_parser("search", help="find games reaching a position or material balance")
+  command.add_argument("pgn")
+  command.add_argument("db", help="position index file")
+  command.add_argument("--build", action="store_true", help="(re)build the index first")
+  command.add_argument("--processes", type=int, default=None)
+  command.add_argument("--fen", help="print the offsets of games reaching this position")
+  command.add_argument("--material", help='e.g. "KRvKB" or "KRPPvKBP"')
+  command.set_defaults(func=search)
+
+  command = commands.add_parser("diagrams", help="draw every ply of every game of a PGN file")
+  command.add_argument("pgn")
+  command.add_argument("out", help="directory to write to")
+  command.add_argument("--output", choices=["gif", "sheet", "png"], default="gif",
+                       help="an animated GIF, a sprite sheet or a PNG per ply (default: gif)")
+  command.add_argument("--size", type=int, default=64, help="square size in pixels")
+  command.add_argument("--flip", action="store_true", help="draw the board from black's side")
+  command.add_argument("--processes", type=int, default=None)
+  command.set_defaults(func=diagrams)
+
+  command = commands.add_parser("pack", help="convert a PGN file to a compact binary game file")
+  command.add_argument("pgn")
+  command.add_argument("out", help="game file to write")
+  command.set_defaults(func=pack)
+
+  command = commands.add_parser("unpack", help="print the games of a game file as PGN")
+  command.add_argument("games", help="file written by the pack command")
+  command.set_defaults(func=unpack)
+
+  return parser
+
+def run(args):
+  import instrument
+
+  if args.stats:
+    instrument.enable()
+  if args.profile:
+    with instrument.profile(args.profile):
+      args.func(args)
+  else:
+    args.func(args)
+  if args.stats:
+    instrument.dump()
+
+if __name__ == "__main__":
+  run(build_parser().parse_args())
@@ -1,6 +1,32 @@
+from board import square_name
+
 class CandidateMove:
   """Represents a candidate move."""
 
   def __init__(self, move, score):
     self.move = move
-    self.score = float(score) # relative
\ No newline at end of file
+    self.score = float(score) # relative
+
+class Move:
+  """Represents a move from one square index to another (see board.py)."""
+
+  def __init__(self, from_square, to_square, promotion=None):
+    self.from_square = from_square
+    self.to_square = to_square
+    self.promotion = promotion # lower case symbol, e.g. "q"
+
+  def uci(self):
+    return "%s%s%s" % (square_name(self.from_square), square_name(self.to_square), self.promotion or "")
+
+  def __eq__(self, other):
+    return (isinstance(other, Move) and self.from_square == other.from_square and
+            self.to_square == other.to_square and self.promotion == other.promotion)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    return hash((self.from_square, self.to_square, self.promotion))
+
+  def __repr__(self):
+    return "Move(%s)" % self.uci()
@@ -0,0 +1,152 @@
+'''Opening explorer statistics over PGN databases.
+
+For every position reached in the first max_plies plies of a set of
+games, an OpeningTree counts, per next move played, the games, white
+wins, draws, black wins and the players' average Elo. Positions are keyed
+by Position.zobrist_key, so transpositions are merged. Trees built from
+different parts of a database (e.g. by worker processes) can be merged,
+and a tree is saved as a SQLite file whose primary key (position, move)
+answers "next moves from this FEN" queries with a single index lookup.
+
+  tree = build_tree_parallel("twic.pgn", max_plies=20)
+  tree.save("openings.db")
+  for move in OpeningDatabase("openings.db").next_moves(fen):
+    print move.move, move.games, move.score()
+'''
+import sqlite3
+
+from position import Position
+from zobrist import signed_key
+from batch import run_ranges, read_games
+
+GAMES, WHITE_WINS, DRAWS, BLACK_WINS, ELO_SUM, ELO_COUNT = range(6)
+
+RESULT_COLUMNS = {"1-0": WHITE_WINS, "1/2-1/2": DRAWS, "0.5-0.5": DRAWS, "0-1": BLACK_WINS}
+
+def _elos(game):
+  elos = []
+  for tag in ("whiteelo", "blackelo"):
+    try:
+      elos.append(int(game.attributes.get(tag, "")))
+    except ValueError:
+      pass
+  return elos
+
+class MoveStats:
+  """Statistics of one move played from a position."""
+
+  def __init__(self, move, counts):
+    self.move = move
+    self.games = counts[GAMES]
+    self.white_wins = counts[WHITE_WINS]
+    self.draws = counts[DRAWS]
+    self.black_wins = counts[BLACK_WINS]
+    self.average_elo = None
+    if counts[ELO_COUNT]:
+      self.average_elo = float(counts[ELO_SUM]) / counts[ELO_COUNT]
+
+  def score(self):
+    '''White's score in the games with a decisive or drawn result.'''
+    decided = self.white_wins + self.draws + self.black_wins
+    if not decided:
+      return None
+    return (self.white_wins + 0.5 * self.draws) / decided
+
+class OpeningTree:
+  """Move statistics keyed by position hash."""
+
+  def __init__(self, max_plies=20):
+    self.max_plies = max_plies
+    self.positions = {} # zobrist key -> {long algebraic move: counts}
+    self.games = 0
+    self.errors = 0
+
+  def add_game(self, game):
+    '''Adds the first max_plies plies of a game.'''
+    column = RESULT_COLUMNS.get(game.attributes.get("result"))
+    elos = _elos(game)
+    position = Position()
+    self.games += 1
+    try:
+      for move in game.mainline_moves()[:self.max_plies]:
+        key = position.zobrist_key
+        long_move = "%s%s%s" % position.move(move)
+        counts = self.positions.setdefault(key, {}).get(long_move)
+        if counts is None:
+          counts = self.positions[key][long_move] = [0] * 6
+        counts[GAMES] += 1
+        if column is not None:
+          counts[column] += 1
+        counts[ELO_SUM] += sum(elos)
+        counts[ELO_COUNT] += len(elos)
+    except Exception:
+      self.errors += 1
+
+  def merge(self, other):
+    '''Adds the statistics of another tree to this one.'''
+    self.games += other.games
+    self.errors += other.errors
+    for key, moves in other.positions.iteritems():
+      own_moves = self.positions.setdefault(key, {})
+      for move, counts in moves.iteritems():
+        own_counts = own_moves.get(move)
+        if own_counts is None:
+          own_moves[move] = list(counts)
+        else:
+          for i in range(6):
+            own_counts[i] += counts[i]
+
+  def next_moves(self, fen):
+    '''Returns MoveStats for the moves played from fen, most played first.'''
+    moves = self.positions.get(Position(fen).zobrist_key, {})
+    return sorted([MoveStats(move, counts) for move, counts in moves.iteritems()],
+                  key=lambda stats: -stats.games)
+
+  def save(self, path):
+    '''Writes the tree to a SQLite file, replacing its previous content.'''
+    db = sqlite3.connect(path)
+    db.execute("DROP TABLE IF EXISTS moves")
+    db.execute("CREATE TABLE moves (key INTEGER, move TEXT, games INTEGER, white_wins INTEGER, "
+               "draws INTEGER, black_wins INTEGER, elo_sum INTEGER, elo_count INTEGER, "
+               "PRIMARY KEY (key, move)) WITHOUT ROWID")
+    rows = ((signed_key(key), move) + tuple(counts)
+            for key, moves in self.positions.iteritems()
+            for move, counts in moves.iteritems())
+    db.executemany("INSERT INTO moves VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    db.commit()
+    db.close()
+
+class OpeningDatabase:
+  """Read access to a tree saved with OpeningTree.save."""
+
+  def __init__(self, path):
+    self.db = sqlite3.connect(path)
+
+  def next_moves(self, fen):
+    '''Returns MoveStats for the moves played from fen, most played first.'''
+    rows = self.db.execute("SELECT move, games, white_wins, draws, black_wins, elo_sum, elo_count "
+                           "FROM moves WHERE key = ? ORDER BY games DESC",
+                           (signed_key(Position(fen).zobrist_key),))
+    return [MoveStats(row[0], row[1:]) for row in rows]
+
+  def close(self):
+    self.db.close()
+
+def build_tree(games, max_plies=20):
+  '''Builds an OpeningTree from an iterable of games.'''
+  tree = OpeningTree(max_plies)
+  for game in games:
+    tree.add_game(game)
+  return tree
+
+def _build_range(args):
+  path, start, end, max_plies = args
+  return build_tree(read_games(path, start, end), max_plies)
+
+def build_tree_parallel(path, max_plies=20, processes=None, chunk_size=4 * 1024 * 1024):
+  '''Builds an OpeningTree from a PGN file, one byte range per task, and
+  merges the partial trees as the worker processes finish them.'''
+  tree = OpeningTree(max_plies)
+  for partial in run_ranges(_build_range, path, (max_plies,), processes, chunk_size, ordered=False):
+    tree.merge(partial)
+  return tree
@@ -0,0 +1,200 @@
+'''Low level PGN scanning.
+
+The movetext of a game is tokenized in a single pass by one compiled
+regular expression, yielding (kind, value) tuples where kind is one of
+MOVE, COMMENT, NAG, VARIATION_START, VARIATION_END or RESULT.
+
+>>> list(tokenize_movetext("1. e4 {best by test} e5 (1... c5) 1-0"))
+[('move', 'e4'), ('comment', 'best by test'), ('move', 'e5'), ('variation_start', '('), ('move', 'c5'), ('variation_end', ')'), ('result', '1-0')]
+'''
+import mmap
+import re
+
+MOVE = "move"
+COMMENT = "comment"
+NAG = "nag"
+VARIATION_START = "variation_start"
+VARIATION_END = "variation_end"
+RESULT = "result"
+
+RESULTS = ["1-0", "0-1", "1/2-1/2", "0.5-0.5", "*"]
+
+MOVETEXT_TOKEN = re.compile(r'''
+  (?:
+    \{(?P<comment>[^}]*)\}?
+  | ;(?P<line_comment>[^\n]*)
+  | (?P<nag>\$\d+)
+  | (?P<variation_start>\()
+  | (?P<variation_end>\))
+  | (?P<result>1-0|0-1|1/2-1/2|0\.5-0\.5|\*)
+  | (?P<number>\d+\.+)
+  | (?P<move>[^\s{}();$]+)
+  )''', re.VERBOSE)
+
+_KINDS = {
+  "comment": COMMENT,
+  "line_comment": COMMENT,
+  "nag": NAG,
+  "variation_start": VARIATION_START,
+  "variation_end": VARIATION_END,
+  "result": RESULT,
+  "move": MOVE,
+}
+
+def tokenize_movetext(movetext):
+  '''Yields the (kind, value) tokens of a movetext string.
+
+  Move numbers are skipped. Comment values do not include their
+  delimiters.
+  '''
+  for match in MOVETEXT_TOKEN.finditer(movetext):
+    group = match.lastgroup
+    if group == "number":
+      continue
+    yield _KINDS[group], match.group(group)
+
+TAG = re.compile(r'\[(\w*)\s*(.+)')
+
+class HeaderRecord:
+  """The tags of a game and the byte offset where the game starts."""
+
+  def __init__(self, offset, tags):
+    self.offset = offset
+    self.tags = tags
+
+  def get(self, name, default=None):
+    return self.tags.get(name, default)
+
+def parse_tag(line):
+  '''Parses a tag line into a (name, value) tuple, see Game.parse_tag.'''
+  tag, value = TAG.match(line).groups()
+  return tag.lower(), value.strip('"[] ')
+
+def read_buffer(pgn_file):
+  '''Returns (data, start): the text of an open PGN file as a read-only
+  mmap and the file's current position in it, or the rest of the file
+  read into a string and 0 where it cannot be mapped (pipes, empty files).'''
+  try:
+    return mmap.mmap(pgn_file.fileno(), 0, access=mmap.ACCESS_READ), pgn_file.tell()
+  except (AttributeError, ValueError, EnvironmentError):
+    return pgn_file.read(), 0
+
+def close_buffer(data):
+  '''Unmaps a buffer returned by read_buffer.'''
+  if isinstance(data, mmap.mmap):
+    data.close()
+
+# a line starting with "[", leading whitespace allowed as line.strip() does
+NEXT_TAG_LINE = re.compile(r'\n[ \t\r\f\v]*\[')
+
+def scan_games(data, predicate=None, start=0):
+  '''Yields (offset, tags, movetext_start, movetext_end) for every game of
+  PGN text held in one string or mmap, without copying the movetext.
+
+  This is the game boundary rule every scanner uses, and the one
+  Game.iter_games follows line by line: a game starts at the first tag
+  line after a movetext line, "%" escape lines are ignored and movetext
+  without tags is a game of its own. Scanning begins at the line starting
+  at start. If predicate is given, only games for which predicate(tags)
+  is true are yielded.
+  '''
+  size = len(data)
+  pos = start
+  tags = None
+  offset = start
+  while pos < size:
+    newline = data.find("\n", pos)
+    if newline == -1:
+      newline = size
+    line = data[pos:newline].strip()
+    if line.startswith('['):
+      if tags is None:
+        tags = {}
+        offset = pos
+      name, value = parse_tag(line)
+      tags[name] = value
+      pos = newline + 1
+    elif line and not line.startswith('%'):
+      if tags is None:
+        tags = {}
+        offset = pos
+      next_tag = NEXT_TAG_LINE.search(data, newline)
+      if next_tag:
+        end = next_tag.start() + 1
+      else:
+        end = size
+      if not predicate or predicate(tags):
+        yield offset, tags, pos, end
+      tags = None
+      pos = end
+    else:
+      pos = newline + 1
+
+  if tags is not None and (not predicate or predicate(tags)):
+    yield offset, tags, size, size
+
+def next_game_offset(data, offset):
+  '''Returns the offset of the first game of data starting at or after
+  offset, which may point into the middle of a game.'''
+  if offset == 0:
+    return 0
+  if data[offset - 1:offset] != "\n":
+    newline = data.find("\n", offset)
+    if newline == -1:
+      return len(data)
+    offset = newline + 1
+  # the first "game" found is the rest of the one offset points into
+  for game_offset, tags, start, end in scan_games(data, start=offset):
+    return end
+  return len(data)
+
+def scan_headers(pgn_file, predicate=None):
+  '''Yields a HeaderRecord for every game of a PGN file, from its current
+  position, without parsing movetext.
+
+  The file is mapped into memory where possible and the movetext of
+  each game is skipped by searching for the next tag line, see
+  scan_games. If predicate is given, only records for which
+  predicate(tags) is true are yielded.
+  '''
+  data, start = read_buffer(pgn_file)
+  try:
+    for offset, tags, movetext_start, movetext_end in scan_games(data, predicate, start):
+      yield HeaderRecord(offset, tags)
+  finally:
+    close_buffer(data)
+
+MOVETEXT_COMMENT = re.compile(r'\{[^}]*\}?|;[^\n]*')
+MOVETEXT_VARIATION = re.compile(r'\([^()]*\)')
+MOVE_NUMBER = re.compile(r'(?<!\d)(\d+)\.(\.\.)?(?!\d)')
+LAST_MOVE_NUMBER = re.compile(r'.*' + MOVE_NUMBER.pattern, re.DOTALL)
+
+def _plies_before(match):
+  return 2 * (int(match.group(1)) - 1) + (match.group(2) and 1 or 0)
+
+def estimate_ply_count(movetext):
+  '''Returns the number of mainline plies of a movetext, read off its
+  first and last move numbers instead of tokenizing the moves.
+
+  The count is exact for well-formed movetext; annotation symbols
+  standing apart from their move ("e4 !") count as plies.
+
+  >>> estimate_ply_count("12... Nf6 {or 12... d5} 13. Bg5 (13. Bf4 e6) h6 1-0")
+  3
+  '''
+  if '{' in movetext or ';' in movetext:
+    movetext = MOVETEXT_COMMENT.sub(" ", movetext)
+  while '(' in movetext:
+    stripped = MOVETEXT_VARIATION.sub(" ", movetext)
+    if stripped == movetext:
+      break
+    movetext = stripped
+  count = 0
+  match = LAST_MOVE_NUMBER.match(movetext)
+  if match:
+    count = _plies_before(match) - _plies_before(MOVE_NUMBER.search(movetext))
+    movetext = movetext[match.end():]
+  for token in movetext.split():
+    if token not in RESULTS and not token.startswith('$'):
+      count += 1
+  return count
@@ -2,9 +2,23 @@
 # for py pgn parser
 
 #import pdb
-import re
 from common import *
 from draw import *
+from board import *
+from bitboard import *
+from zobrist import *
+from move import Move
+from san import parse_san
+from fen import placement_fen, flip_placement, parse_placement
+
+# Castling rights lost when a piece moves from or to these squares.
+CASTLING_RIGHTS_LOST = {
+  SQUARE_INDEX["a1"]: "Q", SQUARE_INDEX["e1"]: "KQ", SQUARE_INDEX["h1"]: "K",
+  SQUARE_INDEX["a8"]: "q", SQUARE_INDEX["e8"]: "kq", SQUARE_INDEX["h8"]: "k",
+}
+
+class MoveError(Exception):
+  """Raised for a move that cannot be read or played in the position."""
 
 class Position:
   """Represents a position."""
@@ -13,13 +27,11 @@ class Position:
     self._generate_from_fen(fen)
   
   def can_castle(self, player, side):
-    side = side[0].lower() # e.g. "king" becomes "k"x
-    player = player[0].lower() # e.g. "king" becomes "k"
+    side_letter = side[0].lower() # e.g. "king" becomes "k"
+    player = player[0].lower() # e.g. "white" becomes "w"
     
     if player == "w":
       side_letter = side_letter.upper()
-    else:
-      side_letter = side_letter.lower()
     
     return side_letter in self.castle_info
   
@@ -31,80 +43,119 @@ class Position:
       player = self.current_player
   
     if not symbol and not end_square:
-      raise BaseException("Must pass either symbol or end_square.")
+      raise ValueError("Must pass either symbol or end_square.")
   
-    for piece in self.pieces:
-      if player != piece.player:
-        continue
+    if player == "w":
+      symbol = symbol.upper()
+    else:
+      symbol = symbol.lower()
   
-      if symbol.lower() != piece.lower_symbol:
+    # Knight, king and sliding attacks are symmetric, so the pieces that
+    # can reach end_square are those attacked from end_square.
+    end_index = SQUARE_INDEX[end_square]
+    occupied = self.board.occupied["w"] | self.board.occupied["b"]
+    candidates = piece_attacks(symbol, end_index, occupied) & self.board.bitboards[symbol]
+    for index in iter_bits(candidates):
+      piece = self.board.get(index)
+      if "move_from" in extra and extra["move_from"] not in piece.position:
         continue
-  
-      if piece.can_move_to(end_square):
-        if "move_from" not in extra:
-          return piece
-        elif extra["move_from"] in piece.position:
-            return piece
+      if not leaves_king_safe(self.board, player, index, end_index):
+        continue
+      return piece
   
   def get_square(self, position):
-    for piece in self.pieces:
-      if piece.position == position:
-        return piece
-    return None
+    index = SQUARE_INDEX.get(position)
+    if index is None:
+      return None
+    return self.board.get(index)
+  
+  @property
+  def pieces(self):
+    return self.board.pieces()
+  
+  @property
+  def zobrist_key(self):
+    '''64-bit Zobrist hash of the position, see zobrist.py.'''
+    return self.board.zobrist ^ self._state_zobrist
+  
+  def _enpassant_zobrist(self, player):
+    '''Zobrist key of the en passant square if player can capture on it.'''
+    index = SQUARE_INDEX.get(self.enpassant)
+    if index is None:
+      return 0
+    if player == "w":
+      pawns, opponent = self.board.bitboards["P"], "b"
+    else:
+      pawns, opponent = self.board.bitboards["p"], "w"
+    if PAWN_ATTACKS[opponent][index] & pawns:
+      return ENPASSANT_KEYS[square_file(index)]
+    return 0
+  
+  def to_planes(self, packed=False):
+    '''Returns the position as a NumPy array of bit planes, see features.py.'''
+    from features import position_planes
+    return position_planes(self, packed)
+  
+  def legal_moves(self):
+    '''Returns the list of legal Moves (see move.py) for the current player.'''
+    return generate_legal_moves(self.board, self.current_player, self.castle_info, self.enpassant)
+  
+  def perft(self, depth):
+    '''Returns the number of leaf positions of the legal move tree to
+    depth, to check move generation against the known counts:
+    
+    >>> Position().perft(3)
+    8902
+    >>> Position("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1").perft(2)
+    2039
+    
+    Mated and stalemated positions are leaves without moves:
+    
+    >>> Position("rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3").perft(1)
+    0
+    >>> Position("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1").perft(4)
+    422333
+    '''
+    if depth == 0:
+      return 1
+    moves = self.legal_moves()
+    if depth == 1:
+      return len(moves)
+    count = 0
+    for move in moves:
+      self.push(move)
+      count += self.perft(depth - 1)
+      self.pop()
+    return count
+  
+  def attackers_to(self, square, player=None):
+    '''Returns the pieces attacking square (e.g. "e4").
+    
+    If player ("w" or "b") is given, only that player's pieces are returned.
+    '''
+    index = SQUARE_INDEX[square]
+    occupied = self.board.occupied["w"] | self.board.occupied["b"]
+    attackers = []
+    for attacking_player in (player and [player] or ["w", "b"]):
+      mask = attackers_mask(self.board.bitboards, attacking_player, index, occupied)
+      attackers.extend(self.board.get(i) for i in iter_bits(mask))
+    return attackers
   
   def generate_fen(self, flip=False):
     return "%s %s %s %s %s %s" % (self.generate_piece_placement_fen(flip), self.current_player, self.castle_info, self.enpassant, self.halfmove_clock, self.move_number)
   
   def generate_piece_placement_fen(self, flip=False):
-    column_letters = ["a", "b", "c", "d", "e", "f", "g", "h"]
-    
-    line_info = ""
-    
-    for row_negative_number in range(8):
-      if not flip:
-        row_number = 8 - row_negative_number
-      else:
-        row_number = 1 + row_negative_number
-      
-      empty_squares = 0
+    placement = placement_fen(self.board)
+    if flip:
+      return flip_placement(placement)
+    return placement
 
-      for column_number in range(8):
-        column_index = column_number
-        if flip:
-          column_index = 7 - column_number
-        
-        position = "%s%i" % (column_letters[column_index], row_number)
-        piece = self.get_square(position)
-        
-        if piece:
-          if empty_squares > 0:
-            line_info += str(empty_squares)
-            empty_squares = 0
-          line_info += piece.symbol
-        else:
-          empty_squares += 1
-      
-      if empty_squares > 0:
-        line_info += str(empty_squares)
-      
-      if (not flip and row_number != 1) or (flip and row_number != 8):
-        line_info += "/"
-      
-    return line_info
-  
   def castle(self, which_side):
     player = self.current_player
     if player == "w":
       row = 1
-      self.castle_info = self.castle_info.replace("k", "")
-      self.castle_info = self.castle_info.replace("q", "")
     else:
       row = 8
-      self.castle_info = self.castle_info.replace("K", "")
-      self.castle_info = self.castle_info.replace("Q", "")
-    
-    if self.castle_info == "":
-      self.castle_info = "-"
     
     king_start_col = "e"
     if which_side == "k":
@@ -116,15 +167,20 @@ class Position:
       rook_end_col = "d"
       king_end_col = "c"
     else:
-      raise BaseException("Cannot castle to unknown side '%s'" % which_side)
+      raise MoveError("Cannot castle to unknown side '%s'" % which_side)
 
     king = self.get_square("%s%s" % (king_start_col, row))
-    assert king.lower_symbol == "k"
-    king.position = "%s%s" % (king_end_col, row)
-    
     rook = self.get_square("%s%s" % (rook_start_col, row))
-    assert rook.lower_symbol == "r"
-    rook.position = "%s%s" % (rook_end_col, row)
+    if king is None or king.lower_symbol != "k" or king.player != player:
+      raise MoveError("Cannot castle, no king on %s%s" % (king_start_col, row))
+    if rook is None or rook.lower_symbol != "r" or rook.player != player:
+      raise MoveError("Cannot castle, no rook on %s%s" % (rook_start_col, row))
+    
+    king_start = king.square
+    self.board.relocate(king, SQUARE_INDEX["%s%s" % (king_end_col, row)])
+    self.board.relocate(rook, SQUARE_INDEX["%s%s" % (rook_end_col, row)])
+    
+    self._update_state(king, king_start, king.square)
     
     return "%s%s" % (king_start_col, row), "%s%s" % (king_end_col, row), ""
         
@@ -136,58 +192,119 @@ class Position:
     
      What is not currently supported?
         descriptive notation
+
+    Returns the from and to squares and the promotion piece:
+
+    >>> position = Position("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2")
+    >>> position.move("exd6")
+    ('e5', 'd6', '')
+    >>> position.generate_fen()
+    '4k3/8/3P4/8/8/8/8/4K3 b - - 0 2'
+    >>> position = Position("8/4P3/8/8/8/8/k7/4K3 w - - 0 1")
+    >>> position.move("e8=Q")
+    ('e7', 'e8', 'q')
+    >>> position.generate_fen()
+    '4Q3/8/8/8/8/8/k7/4K3 b - - 0 1'
+    >>> position = Position("4k3/8/8/8/8/8/1pK5/R7 b - - 0 1")
+    >>> position.move("bxa1=N+")
+    ('b2', 'a1', 'n')
+    >>> position.generate_fen()
+    '4k3/8/8/8/8/8/2K5/n7 w - - 0 2'
+    >>> position = Position("5k2/8/8/8/8/8/8/4K2R w K - 0 1")
+    >>> position.move("O-O+")
+    ('e1', 'g1', '')
+    >>> position.generate_fen()
+    '5k2/8/8/8/8/8/8/5RK1 b - - 1 1'
     """
     command = command.strip()
     before_square, after_square, extra = self.move_process_main(command)
     self.move_postprocess()
     return before_square, after_square, extra
   
+  def push(self, move):
+    '''Makes a move that can be taken back with pop().
+    
+    move is a Move (see legal_moves) or any command accepted by move().
+    Only the board changes and the previous game state are recorded, so
+    variations can be walked without copying the position.
+    '''
+    state = (self.current_player, self.castle_info, self.enpassant, self.halfmove_clock,
+             self.move_number, self._state_zobrist, self._enpassant_key)
+    self.board.journal = []
+    try:
+      if isinstance(move, Move):
+        result = self.move_from_to(SQUARE_NAMES[move.from_square], SQUARE_NAMES[move.to_square],
+                                   move.uci(), move.promotion)
+        self.move_postprocess()
+      else:
+        result = self.move(move)
+    except:
+      self.board.undo(self.board.journal)
+      self.board.journal = None
+      self._restore_state(state)
+      raise
+    self._undo_stack.append((self.board.journal, state))
+    self.board.journal = None
+    return result
+  
+  def pop(self):
+    '''Takes back the last move made with push().
+    
+    Walking a move tree leaves the position and its Zobrist key as they
+    were, and the incrementally kept key matches a freshly computed one:
+    
+    >>> position = Position("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    >>> key, fen = position.zobrist_key, position.generate_fen()
+    >>> position.perft(3)
+    97862
+    >>> position.zobrist_key == key and position.generate_fen() == fen
+    True
+    >>> position = Position()
+    >>> for move in ["e4", "d5", "e5", "f5", "exf6", "Nc6", "Nf3", "Bg4", "Bb5", "Qd7", "O-O", "O-O-O"]:
+    ...   result = position.push(move)
+    ...   assert position.zobrist_key == Position(position.generate_fen()).zobrist_key, move
+    '''
+    journal, state = self._undo_stack.pop()
+    self.board.undo(journal)
+    self._restore_state(state)
+  
+  def _restore_state(self, state):
+    (self.current_player, self.castle_info, self.enpassant, self.halfmove_clock,
+     self.move_number, self._state_zobrist, self._enpassant_key) = state
+  
   def move_process_main(self, command):
-    if command in ["O-O", "o-o", "0-0"]:
-      return self.castle("k")
+    san = parse_san(command)
+    if san is None:
+      return "", "", ""
     
-    if command in ["O-O-O", "o-o-o", "0-0-0"]:
-      return self.castle("q")
+    if san.castle:
+      return self.castle(san.castle)
     
-    matching = re.match(r'^([BNRQK])([a-h])?x?([a-h][0-8])', command)
-    if matching:
-      move_piece_command = command
-      move_from_info = matching.groups()[1]
-      extra = {}
-      if move_from_info:
-        extra = {"move_from": move_from_info}
-        move_piece_command = "%s%s" % (matching.groups()[0], matching.groups()[2])
-      return self.move_piece(move_piece_command, extra)
-    
-    matching = re.match(r'^([a-h][0-8])-?([a-h][0-8])', command)
-    if matching:
-      move_from = matching.groups()[0]
-      move_to = matching.groups()[1]
-      return self.move_from_to(move_from, move_to, command)
-    
-    matching = re.match(r'^([a-h][0-8]-)?([a-h][0-8])', command)
-    if matching:
-      return self.move_pawn(matching.groups()[1])
+    if san.piece is None:
+      # coordinates, e.g. e2e4 or e7e8q
+      return self.move_from_to(san.from_file + san.from_rank, san.target, command, san.promotion)
     
-    matching = re.match(r'[a-h]x[a-h][0-8]', command)
-    if matching:
-      return self.take_with_pawn(command)
+    if san.piece != "P":
+      extra = {}
+      if san.from_file or san.from_rank:
+        extra = {"move_from": (san.from_file or "") + (san.from_rank or "")}
+      return self._move_piece(command, san.piece, san.target, extra)
     
-    matching = re.match(r'([a-h])[0-8]x([a-h][0-8])', command)
-    if matching:
-      return self.take_with_pawn("%sx%s%s" % (matching.groups()[0], matching.groups()[1], matching.groups()[2]))
+    if san.capture or san.from_file:
+      return self.take_with_pawn("%sx%s" % (san.from_file, san.target), san.promotion)
     
-    return "", "", ""
+    return self.move_pawn(san.target, promotion=san.promotion)
   
-  def generate_image(self, flip=False):
-    board = chess_position_using_font(self.generate_piece_placement_fen(flip), os.getcwd() + '/chess_merida_unicode.ttf', 64)
+  def generate_image(self, flip=False, sq_size=64, font_file=FONT_FILE):
+    board = get_renderer(font_file, sq_size).render(self.generate_piece_placement_fen(flip))
     return board
   
-  def save_image(self, filename, flip=False):
-    board = self.generate_image(flip)
+  def save_image(self, filename, flip=False, sq_size=64, font_file=FONT_FILE):
+    board = self.generate_image(flip, sq_size, font_file)
     board.convert('RGB').save("%s" % filename)
     
-  def take_with_pawn(self, command):
+  def take_with_pawn(self, command, promotion=None):
+    # e.g. "exd5"
     after_position = command[2:4]
     
     before_col = command[0]
@@ -201,21 +318,25 @@ class Position:
     before_position = "%s%i" % (before_col, before_row)    
     piece = self.get_square(before_position)
     if not piece:
-      raise BaseException("Unable to interpret move %s" % command)
+      raise MoveError("Unable to interpret move %s" % command)
     
     taken_piece = self.get_square(after_position)
+    if not taken_piece and after_position == self.enpassant:
+      # en passant, the captured pawn is beside the moving pawn
+      taken_piece = self.get_square("%s%i" % (after_position[0], before_row))
     if not taken_piece:
-      raise BaseException("Move %s could not find the captured piece on square %s" % (command, after_position))
+      raise MoveError("Move %s could not find the captured piece on square %s" % (command, after_position))
     
     self.remove_piece(taken_piece)
-    piece.position = after_position
+    self.board.relocate(piece, SQUARE_INDEX[after_position])
+    self._update_state(piece, SQUARE_INDEX[before_position], piece.square, taken_piece)
     
-    return before_position, after_position, ""
+    return before_position, after_position, self._promote_pawn(piece, promotion)
   
-  def move_from_to(self, move_from, move_to, original_command=""):
+  def move_from_to(self, move_from, move_to, original_command="", promotion=None):
     piece = self.get_square(move_from)
     if not piece:
-      raise BaseException("Unable to interpret move %s, from %s to %s." % (original_command, move_from, move_to))
+      raise MoveError("Unable to interpret move %s, from %s to %s." % (original_command, move_from, move_to))
     
     if piece.lower_symbol == "k":
       # special check for castling
@@ -229,14 +350,37 @@ class Position:
         return self.castle("q")
     
     taken_piece = self.get_square(move_to)
+    if not taken_piece and piece.lower_symbol == "p" and move_to == self.enpassant:
+      # en passant, the captured pawn is beside the moving pawn
+      taken_piece = self.get_square(move_to[0] + move_from[1])
     if taken_piece:
       self.remove_piece(taken_piece)
     
-    piece.position = move_to
-    
-    return move_from, move_from, ""
+    self.board.relocate(piece, SQUARE_INDEX[move_to])
+    self._update_state(piece, SQUARE_INDEX[move_from], piece.square, taken_piece)
     
-  def move_pawn(self, command, before_position=None):
+    return move_from, move_to, self._promote_pawn(piece, promotion)
+  
+  def promote(self, pawn, symbol):
+    '''Replaces a pawn with a piece of the given symbol (any case).'''
+    square = pawn.square
+    self.remove_piece(pawn)
+    if pawn.is_white:
+      symbol = symbol.upper()
+    else:
+      symbol = symbol.lower()
+    self.board.put(Piece(symbol), square)
+  
+  def _promote_pawn(self, piece, promotion):
+    '''Promotes piece if it is a pawn that reached the last rank and a
+    promotion was given. Returns the promotion suffix of the long
+    algebraic move ("q", "n", ...) or "".'''
+    if promotion and piece.lower_symbol == "p" and SQUARE_RANKS[piece.square] in (0, 7):
+      self.promote(piece, promotion)
+      return promotion.lower()
+    return ""
+    
+  def move_pawn(self, command, before_position=None, promotion=None):
     # e.g. "d4"
     after_position = command
     col = after_position[0]
@@ -260,33 +404,64 @@ class Position:
     
     piece = self.get_square(before_position)
     if not piece:
-      raise BaseException("Unable to interpret move %s" % command)
-    piece.position = after_position
+      raise MoveError("Unable to interpret move %s" % command)
+    self.board.relocate(piece, SQUARE_INDEX[after_position])
+    self._update_state(piece, SQUARE_INDEX[before_position], piece.square)
     
-    return before_position, after_position, ""
+    return before_position, after_position, self._promote_pawn(piece, promotion)
   
   def move_piece(self, command, extra={}):
     command = command.replace("x", "")
     command = command.replace("X", "")
     command = command.replace("-", "")
-    piece_symbol = command[0]
-    after_position = command[1:3]
-
+    return self._move_piece(command, command[0], command[1:3], extra)
+  
+  def _move_piece(self, command, piece_symbol, after_position, extra={}):
     piece = self.get_piece(piece_symbol, after_position, self.current_player, extra)
     if not piece:
-      raise BaseException("Unable to interpret move %s. (Could not find piece %s that can move to %s)" % (command, piece_symbol, after_position))
+      raise MoveError("Unable to interpret move %s. (Could not find piece %s that can move to %s)" % (command, piece_symbol, after_position))
     
     taken_piece = self.get_square(after_position)
     if taken_piece:
       self.remove_piece(taken_piece)
     
-    before_position = piece.position
-    piece.position = after_position
+    before_index = piece.square
+    self.board.relocate(piece, SQUARE_INDEX[after_position])
+    self._update_state(piece, before_index, piece.square, taken_piece)
+    
+    return SQUARE_NAMES[before_index], after_position, ""
+  
+  def _update_state(self, piece, before_index, after_index, taken_piece=None):
+    '''Updates the halfmove clock, en passant square and castling rights
+    after piece moved from before_index to after_index.'''
+    if piece.lower_symbol == "p" or taken_piece:
+      self.halfmove_clock = 0
+    else:
+      self.halfmove_clock += 1
+    
+    self._state_zobrist ^= self._enpassant_key ^ castling_key(self.castle_info)
+    
+    if piece.lower_symbol == "p" and abs(after_index - before_index) == 16:
+      self.enpassant = SQUARE_NAMES[(before_index + after_index) // 2]
+      if self.current_player == "w":
+        self._enpassant_key = self._enpassant_zobrist("b")
+      else:
+        self._enpassant_key = self._enpassant_zobrist("w")
+    else:
+      self.enpassant = "-"
+      self._enpassant_key = 0
+    
+    for index in (before_index, after_index):
+      if index in CASTLING_RIGHTS_LOST:
+        for right in CASTLING_RIGHTS_LOST[index]:
+          self.castle_info = self.castle_info.replace(right, "")
+    if self.castle_info == "":
+      self.castle_info = "-"
     
-    return before_position, after_position, ""
+    self._state_zobrist ^= self._enpassant_key ^ castling_key(self.castle_info)
   
   def move_postprocess(self):
-    self.halfmove_clock += 1
+    self._state_zobrist ^= BLACK_TO_MOVE_KEY
     if self.current_player == "w":
       self.current_player = "b"
     else:
@@ -294,10 +469,7 @@ class Position:
       self.move_number += 1
   
   def remove_piece(self, piece):
-    index = self.pieces.index(piece)
-    if index:
-      self.pieces.pop(index)
-      del piece
+    self.board.remove(piece)
     
   def _generate_from_fen(self, fen):
     fen_split = fen.split(" ")
@@ -316,35 +488,45 @@ class Position:
     except:
       self.move_number = 0
     
-    self.pieces = []
-    
-    row = 9
-    column_letters = ["a", "b", "c", "d", "e", "f", "g", "h"]
-    for line in fen_split[0].split("/"):
-      row -= 1
-      col = -1
-      for char in line:
-        col += 1
-        try:
-          # is number
-          col += int(char)
-          col -= 1
-        except:
-          # is letter
-          piece = Piece(char, "%s%i" % (column_letters[col], row))
-          self.pieces.append(piece)
+    self.board = Board()
+    self._undo_stack = []
+    
+    for symbol, index in parse_placement(fen_split[0]):
+      self.board.put(Piece(symbol), index)
+    
+    self._enpassant_key = self._enpassant_zobrist(self.current_player)
+    self._state_zobrist = (castling_key(self.castle_info) ^ self._enpassant_key ^
+                           side_key(self.current_player))
 
-class Piece:
-  def __init__(self, symbol="", position=""):
-    self.is_white = symbol.upper() == symbol
-    self.is_black = not self.is_white
-    if self.is_white:
-      self.player = "w"
-    else:
-      self.player = "b"
-    self.symbol = symbol
-    self.lower_symbol = symbol.lower()
-    self.position = position
+class Piece(object):
+  """A piece on (or off) the board.
+  
+  Pieces are flyweights: everything that only depends on the symbol
+  (player, colour, lower case symbol) lives on one shared class per
+  symbol, see PIECE_TYPES, and an instance only stores its square index.
+  Piece("N") returns an instance of the white knight class.
+  """
+  __slots__ = ("square",)
+  
+  def __new__(cls, symbol, position=""):
+    if cls is Piece:
+      if symbol not in PIECE_TYPES:
+        raise ValueError("Unknown piece symbol '%s'." % symbol)
+      cls = PIECE_TYPES[symbol]
+    return object.__new__(cls)
+  
+  def __init__(self, symbol, position=""):
+    self.square = SQUARE_INDEX.get(position)
+  
+  def __reduce__(self):
+    # the per-symbol classes are not module attributes, so pickle by symbol
+    return Piece, (self.symbol, self.position)
+  
+  @property
+  def position(self):
+    if self.square is None:
+      return ""
+    return SQUARE_NAMES[self.square]
   
   def can_move_to(self, square):
     if self.lower_symbol == "k":
@@ -358,60 +540,57 @@ class Piece:
     elif self.lower_symbol == "r":
       return self.can_rook_move_to(square)
     else:
-      raise BaseException("Unkown piece symbol '%s'." % self.lower_symbol)
+      raise ValueError("Unkown piece symbol '%s'." % self.lower_symbol)
+  
+  def _distances(self, square):
+    '''Returns the (file, rank) distances to a square name.'''
+    to_index = SQUARE_INDEX[square]
+    return (abs(SQUARE_FILES[self.square] - SQUARE_FILES[to_index]),
+            abs(SQUARE_RANKS[self.square] - SQUARE_RANKS[to_index]))
   
   def can_king_move_to(self, square):
-    col = Piece.col_to_number(self.col())
-    to_col = Piece.col_to_number(square[0])
-    
-    row = int(self.row())
-    to_row = int(square[1])
-    
-    return abs(row - to_row) <= 1 and abs(col - to_col) <= 1
+    col_diff, row_diff = self._distances(square)
+    return row_diff <= 1 and col_diff <= 1
   
   def can_queen_move_to(self, square):
     return self.can_bishop_move_to(square) or self.can_rook_move_to(square)
     
   def can_knight_move_to(self, square):
-    col = Piece.col_to_number(self.col())
-    to_col = Piece.col_to_number(square[0])
-    
-    row = int(self.row())
-    to_row = int(square[1])
-    
-    row_diff = abs(row - to_row)
-    col_diff = abs(col - to_col)
-    
+    col_diff, row_diff = self._distances(square)
     return (row_diff == 1 and col_diff == 2) or (row_diff == 2 and col_diff == 1)
     
   def can_bishop_move_to(self, square):
-    col = Piece.col_to_number(self.col())
-    to_col = Piece.col_to_number(square[0])
-    
-    row = int(self.row())
-    to_row = int(square[1])
-    
-    return abs(row - to_row) == abs(col - to_col)
+    col_diff, row_diff = self._distances(square)
+    return row_diff == col_diff
     
   def can_rook_move_to(self, square):
-    col = Piece.col_to_number(self.col())
-    to_col = Piece.col_to_number(square[0])
-    
-    row = int(self.row())
-    to_row = int(square[1])
-    
-    return col == to_col or row == to_row
+    col_diff, row_diff = self._distances(square)
+    return col_diff == 0 or row_diff == 0
   
   def col(self):
-    return self.position[0]
+    return FILES[SQUARE_FILES[self.square]]
   
   def row(self):
-    return self.position[1]
+    return RANKS[SQUARE_RANKS[self.square]]
   
   @staticmethod
   def col_to_number(col):
-    return ["a", "b", "c", "d", "e", "f", "g", "h"].index(col)
+    return FILE_NUMBERS[col]
     
   @staticmethod
   def generate_all_move_squares(type):
     pass
+
+def _piece_type(symbol):
+  is_white = symbol.upper() == symbol
+  return type("Piece_%s" % symbol, (Piece,), {
+    "__slots__": (),
+    "symbol": symbol,
+    "lower_symbol": symbol.lower(),
+    "is_white": is_white,
+    "is_black": not is_white,
+    "player": is_white and "w" or "b",
+  })
+
+# the shared class of each piece symbol
+PIECE_TYPES = dict((symbol, _piece_type(symbol)) for symbol in PIECE_SYMBOLS)
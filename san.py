@@ -0,0 +1,66 @@
+'''Parsing of moves in standard algebraic notation (SAN).
+
+One compiled grammar turns a move string into a SanMove record, and
+the records of the move strings seen are memoized, so "Nf3" or "O-O"
+is only parsed once however many games play it:
+
+  >>> parse_san("exd8=Q+")
+  SanMove(piece='P', from_file='e', from_rank=None, capture=True, target='d8', promotion='Q', check='+', castle=None)
+
+Besides SAN the grammar accepts the coordinate forms Position.move
+always has ("e2e4", "e2-e4", "e7e8q", "g1f3"); for these piece is None
+as the moving piece is whatever stands on the from square.
+'''
+import collections
+import re
+
+SAN = re.compile(r'''
+  (?:
+    (?P<castle>[O0o]-[O0o](?P<long>-[O0o])?)
+  | (?P<piece>[KQRBN])?
+    (?P<from_file>[a-h])?(?P<from_rank>[1-8])?
+    (?P<capture>[xX:])?-?
+    (?P<target>[a-h][1-8])
+    (?:=?(?P<promotion>[QRBNqrbn]))?
+  )
+  (?P<check>[+#])?
+''', re.VERBOSE)
+
+SanMove = collections.namedtuple("SanMove",
+  "piece from_file from_rank capture target promotion check castle")
+
+CACHE_SIZE = 4096
+
+_cache = {}
+
+def _parse(command):
+  match = SAN.match(command)
+  if not match:
+    return None
+  (castle, long_castle, piece, from_file, from_rank, capture, target, promotion,
+   check) = match.group("castle", "long", "piece", "from_file", "from_rank",
+                        "capture", "target", "promotion", "check")
+  if castle:
+    return SanMove("K", None, None, False, None, None, check, long_castle and "q" or "k")
+  if not piece and not (from_file and from_rank):
+    piece = "P"
+  return SanMove(piece, from_file, from_rank, bool(capture), target,
+                 promotion and promotion.upper(), check, None)
+
+def parse_san(command):
+  '''Returns the SanMove of a move string, or None if it is not a move.
+
+  Results are memoized; the memo is emptied when it holds CACHE_SIZE
+  strings, which a corpus of ordinary games hardly reaches.
+  '''
+  try:
+    return _cache[command]
+  except KeyError:
+    pass
+  if len(_cache) >= CACHE_SIZE:
+    _cache.clear()
+  record = _cache[command] = _parse(command)
+  return record
+
+def clear_cache():
+  _cache.clear()
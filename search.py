@@ -0,0 +1,118 @@
+'''Inverted index of the positions and material balances reached in the
+games of a PGN file.
+
+Building the index replays every game once and stores, in SQLite, the
+Zobrist key of every position reached and the material signature after
+every capture or promotion, each with the byte offset of the game and
+the first ply it occurred at. Queries then return game offsets (usable
+with Game.load_at or index.PgnIndex) without replaying anything.
+
+  search = PositionSearch.build("twic.pgn", "twic.search")
+  search.find_position("r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3")
+  search.find_material("KRvKB")      # rook against bishop, any pawns
+  search.find_material("KRPPvKRP")   # exact material
+'''
+import sqlite3
+
+from position import Position
+from zobrist import signed_key
+from index import scan_game_offsets
+from batch import run_ranges
+
+SIGNATURE_ORDER = "KQRBNP"
+
+def material_signature(board, pawns=True):
+  '''Returns the material on a board as e.g. "KRPPvKBP" (white first).
+
+  With pawns=False the pawns are left out, e.g. "KRvKB".
+  '''
+  sides = []
+  for symbols in (SIGNATURE_ORDER, SIGNATURE_ORDER.lower()):
+    side = ""
+    for symbol in symbols:
+      if pawns or symbol not in "Pp":
+        side += symbol.upper() * len(board.piece_lists[symbol])
+    sides.append(side)
+  return "v".join(sides)
+
+def _material_counts(board):
+  pieces = board.occupied["w"] | board.occupied["b"]
+  pawns = board.bitboards["P"] | board.bitboards["p"]
+  return bin(pieces).count("1"), bin(pawns).count("1")
+
+def index_game(game):
+  '''Returns the ({key: ply}, {signature: ply}) of the first occurrence of
+  every position and material signature in a game.'''
+  position = Position()
+  keys = {position.zobrist_key: 0}
+  signatures = {}
+  for signature in (material_signature(position.board), material_signature(position.board, False)):
+    signatures[signature] = 0
+  material = _material_counts(position.board)
+  ply = 0
+  try:
+    for move in game.mainline_moves():
+      position.move(move)
+      ply += 1
+      keys.setdefault(position.zobrist_key, ply)
+      # only captures and promotions change the material
+      if _material_counts(position.board) != material:
+        material = _material_counts(position.board)
+        signatures.setdefault(material_signature(position.board), ply)
+        signatures.setdefault(material_signature(position.board, False), ply)
+  except Exception:
+    pass
+  return keys, signatures
+
+def _index_range(args):
+  path, start, end = args
+  position_rows = []
+  material_rows = []
+  with open(path, "rb") as pgn_file:
+    pgn_file.seek(start)
+    for offset, length, game in scan_game_offsets(pgn_file):
+      if offset >= end:
+        break
+      keys, signatures = index_game(game)
+      position_rows.extend((signed_key(key), offset, ply) for key, ply in keys.iteritems())
+      material_rows.extend((signature, offset, ply) for signature, ply in signatures.iteritems())
+  return position_rows, material_rows
+
+class PositionSearch:
+  """Position and material queries over an indexed PGN file."""
+
+  def __init__(self, path):
+    self.db = sqlite3.connect(path)
+    self.db.execute("CREATE TABLE IF NOT EXISTS positions (key INTEGER, offset INTEGER, ply INTEGER, "
+                    "PRIMARY KEY (key, offset)) WITHOUT ROWID")
+    self.db.execute("CREATE TABLE IF NOT EXISTS material (signature TEXT, offset INTEGER, ply INTEGER, "
+                    "PRIMARY KEY (signature, offset)) WITHOUT ROWID")
+
+  @staticmethod
+  def build(pgn_path, path, processes=None, chunk_size=4 * 1024 * 1024):
+    '''Indexes every game of a PGN file into the SQLite file at path,
+    replaying the games in a pool of worker processes.'''
+    search = PositionSearch(path)
+    for position_rows, material_rows in run_ranges(_index_range, pgn_path, (), processes,
+                                                   chunk_size, ordered=False):
+      search.db.executemany("INSERT OR IGNORE INTO positions VALUES (?, ?, ?)", position_rows)
+      search.db.executemany("INSERT OR IGNORE INTO material VALUES (?, ?, ?)", material_rows)
+      search.db.commit()
+    return search
+
+  def find_position(self, fen):
+    '''Returns (offset, ply) of the games that reached the position of fen,
+    in file order. Move counters in fen are ignored.'''
+    rows = self.db.execute("SELECT offset, ply FROM positions WHERE key = ? ORDER BY offset",
+                           (signed_key(Position(fen).zobrist_key),))
+    return rows.fetchall()
+
+  def find_material(self, signature):
+    '''Returns (offset, ply) of the games that reached a material signature
+    such as "KRvKB" (pieces only) or "KRPPvKBP" (exact), in file order.'''
+    rows = self.db.execute("SELECT offset, ply FROM material WHERE signature = ? ORDER BY offset",
+                           (signature,))
+    return rows.fetchall()
+
+  def close(self):
+    self.db.close()
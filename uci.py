@@ -0,0 +1,141 @@
+'''Engine independent parts of the UCI protocol: search limits, parsing
+of "info" lines and the results of a search. Shared by Engine
+(engine.py) and AsyncEngine (async_engine.py).
+'''
+import re
+
+from move import CandidateMove
+
+class Limit:
+  """Limits of a search: depth in plies, movetime in milliseconds, nodes."""
+
+  def __init__(self, depth=None, movetime=None, nodes=None):
+    if depth is None and movetime is None and nodes is None:
+      raise ValueError("A search limit needs a depth, movetime or nodes.")
+    self.depth = depth
+    self.movetime = movetime
+    self.nodes = nodes
+
+  def go_command(self):
+    command = "go"
+    if self.depth is not None:
+      command += " depth %i" % self.depth
+    if self.movetime is not None:
+      command += " movetime %i" % self.movetime
+    if self.nodes is not None:
+      command += " nodes %i" % self.nodes
+    return command
+
+  def __repr__(self):
+    return "Limit(depth=%r, movetime=%r, nodes=%r)" % (self.depth, self.movetime, self.nodes)
+
+INFO_INTEGER_FIELDS = ["depth", "seldepth", "multipv", "nodes", "nps", "time",
+                       "hashfull", "tbhits", "currmovenumber"]
+
+def parse_info(line):
+  '''Parses a UCI "info" line into a dictionary.
+
+  >>> info = parse_info("info depth 12 multipv 1 score cp 31 nodes 5000 pv e2e4 e7e5")
+  >>> info["depth"], info["score"], info["pv"]
+  (12, ('cp', 31), ['e2e4', 'e7e5'])
+
+  score is a (kind, value) tuple where kind is "cp" or "mate", and
+  "lowerbound"/"upperbound" are reported as a "bound" entry.
+  '''
+  info = {}
+  tokens = line.split()
+  i = 1
+  while i < len(tokens):
+    token = tokens[i]
+    if token in INFO_INTEGER_FIELDS and i + 1 < len(tokens):
+      try:
+        info[token] = int(tokens[i + 1])
+      except ValueError:
+        pass
+      i += 2
+    elif token == "score" and i + 2 < len(tokens):
+      info["score"] = (tokens[i + 1], int(tokens[i + 2]))
+      i += 3
+    elif token in ("lowerbound", "upperbound"):
+      info["bound"] = token
+      i += 1
+    elif token == "currmove" and i + 1 < len(tokens):
+      info["currmove"] = tokens[i + 1]
+      i += 2
+    elif token == "pv":
+      info["pv"] = tokens[i + 1:]
+      break
+    elif token == "string":
+      info["string"] = " ".join(tokens[i + 1:])
+      break
+    else:
+      i += 1
+  return info
+
+class Analysis:
+  """The result of one search: the best move and the info lines seen."""
+
+  def __init__(self):
+    self.bestmove = None
+    self.ponder = None
+    self.infos = []
+    self.lines = {} # multipv number -> last info with a pv
+
+  def add_info(self, info):
+    self.infos.append(info)
+    if "pv" in info and "score" in info and "bound" not in info:
+      self.lines[info.get("multipv", 1)] = info
+
+  def depth(self):
+    if not self.lines:
+      return 0
+    return max(info.get("depth", 0) for info in self.lines.values())
+
+  def candidate_moves(self):
+    '''Returns a CandidateMove per principal variation, best first.'''
+    candidates = []
+    for number in sorted(self.lines):
+      info = self.lines[number]
+      candidates.append(CandidateMove(info["pv"][0], info["score"][1]))
+    return candidates
+
+def position_command(moves=None, fen=None):
+  '''Returns the UCI "position" command for a list of long algebraic
+  moves played from the starting position or from fen.'''
+  if fen:
+    command = "position fen %s" % fen
+  else:
+    command = "position startpos"
+  if moves:
+    command += " moves %s" % " ".join(moves)
+  return command
+
+def two_top_moves(engine, moves, limit=None, thinking=None):
+  '''Returns the two best CandidateMoves (None where there are fewer)
+  engine.analyse finds after moves, searched to limit (a Limit, by
+  default as in analyse). thinking, or a number passed as limit, is a
+  search time in seconds.'''
+  if isinstance(limit, (int, long, float)):
+    limit, thinking = None, limit
+  if thinking is not None:
+    limit = Limit(movetime=int(thinking * 1000))
+  analysis = engine.analyse(moves, limit, multipv=2)
+  candidate_moves = analysis.candidate_moves() + [None, None]
+  return candidate_moves[0], candidate_moves[1]
+
+def parse_option(line):
+  '''Parses a UCI "option" line into a (name, default) tuple, or None.'''
+  matching = re.match(r'option name (.*?) type (\S+)(?: default (.*?))?(?: min |$| var )', line)
+  if matching:
+    return matching.groups()[0], matching.groups()[2]
+  return None
+
+def parse_bestmove(line):
+  '''Parses a UCI "bestmove" line into a (bestmove, ponder) tuple.'''
+  tokens = line.split()
+  bestmove = ponder = None
+  if len(tokens) > 1 and tokens[1] != "(none)":
+    bestmove = tokens[1]
+  if len(tokens) > 3 and tokens[2] == "ponder":
+    ponder = tokens[3]
+  return bestmove, ponder
@@ -0,0 +1,46 @@
+'''Zobrist hashing of positions.
+
+A position's key is the XOR of a random 64-bit number per (piece,
+square), per castling right, for the en passant file when an en
+passant capture is possible, and for black to move. Board keeps the
+piece part up to date as pieces are put, removed and relocated, and
+Position keeps the rest up to date as moves are made, so
+Position.zobrist_key never has to be recomputed from scratch.
+
+The numbers come from a fixed seed, so keys are stable across runs and
+processes and can be stored on disk.
+'''
+import random
+
+_random = random.Random(0x0C4E55B0)
+
+PIECE_KEYS = dict((symbol, [_random.getrandbits(64) for index in range(64)])
+                  for symbol in "KQRBNPkqrbnp")
+CASTLING_KEYS = dict((right, _random.getrandbits(64)) for right in "KQkq")
+ENPASSANT_KEYS = [_random.getrandbits(64) for file in range(8)]
+BLACK_TO_MOVE_KEY = _random.getrandbits(64)
+
+def castling_key(castle_info):
+  key = 0
+  for right in castle_info:
+    if right in CASTLING_KEYS:
+      key ^= CASTLING_KEYS[right]
+  return key
+
+def side_key(player):
+  if player == "b":
+    return BLACK_TO_MOVE_KEY
+  return 0
+
+def board_key(board):
+  '''Computes the piece part of the key of a Board from scratch.'''
+  key = 0
+  for piece in board.pieces():
+    key ^= PIECE_KEYS[piece.symbol][piece.square]
+  return key
+
+def signed_key(key):
+  '''Maps a key to the signed 64-bit range, e.g. for SQLite integers.'''
+  if key >= 1 << 63:
+    return key - (1 << 64)
+  return key